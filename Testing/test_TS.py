@@ -1,11 +1,16 @@
+import io
+import threading
 import unittest
 import numpy as np
 
 from eBCSgen.Core.Complex import Complex
 from eBCSgen.Core.Structure import StructureAgent
 from eBCSgen.TS.Edge import Edge
+from eBCSgen.TS.Frontier import Frontier
 from eBCSgen.TS.State import State, Vector, Memory
-from eBCSgen.TS.TransitionSystem import TransitionSystem
+from eBCSgen.TS.StateStore import VectorStore
+from eBCSgen.TS.TransitionSystem import TransitionSystem, write_chunks, CHUNK_SIZE
+from eBCSgen.TS.TSworker import TSworker, BATCH_SIZE
 
 import Testing.objects_testing as objects
 
@@ -105,3 +110,73 @@ class TestTransitionSystem(unittest.TestCase):
         new_hell = State(Vector(np.array([5, 5, 5])), Memory(0), True)
         new_encoding = {1: self.s1, 2: self.s2, 0: self.s3, 3: new_hell}
         self.assertEqual(ts.states_encoding, new_encoding)
+
+    def test_vector_store(self):
+        store = VectorStore(3, 5, capacity=2)
+        self.assertEqual(store.add(self.s1), (1, True))
+        self.assertEqual(store.add(self.s2), (2, True))
+        self.assertEqual(store.add(self.hell), (3, True))
+        self.assertEqual(store.add(State(Vector(np.array((1.0, 2.0, 3.0))), Memory(0))), (1, False))
+        self.assertEqual(store.add(self.s3), (4, True))
+
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.code(self.s2), 2)
+        self.assertIsNone(store.code(self.s4))
+        self.assertEqual(store[3], self.hell)
+        self.assertEqual(dict(store), {1: self.s1, 2: self.s2, 3: self.hell, 4: self.s3})
+        self.assertEqual(store.vectors.dtype, np.uint8)
+
+    def test_frontier_pause(self):
+        frontier = Frontier(range(1, 2 * BATCH_SIZE + 1))
+        started, release = threading.Event(), threading.Event()
+        processed = []
+
+        class Worker(TSworker):
+            def process(self, code):
+                processed.append(code)
+                started.set()
+                release.wait()
+
+        worker = Worker(None, None, frontier)
+        worker.start()
+        self.addCleanup(worker.join)
+        self.addCleanup(frontier.stop)
+        started.wait()
+
+        # pause arrives while the worker is processing the first state of its batch
+        pausing = threading.Thread(target=frontier.pause)
+        pausing.start()
+        while not frontier.paused:
+            pass
+        release.set()
+        pausing.join()
+
+        # the rest of the batch is returned to the frontier
+        self.assertEqual(processed, [1])
+        self.assertEqual(frontier.remaining(), set(range(2, 2 * BATCH_SIZE + 1)))
+
+    def test_write_chunks(self):
+        lines = [str(i) for i in range(2 * CHUNK_SIZE + 3)]
+        output = io.StringIO()
+        write_chunks(output, iter(lines))
+        self.assertEqual(output.getvalue(), ", ".join(lines))
+
+        output = io.StringIO()
+        write_chunks(output, [])
+        self.assertEqual(output.getvalue(), "")
+
+    def test_to_sparse(self):
+        self.ts_bigger.edges.add(Edge(2, 2, "(k1)/(k1 + 2)", "r"))
+        matrix, labels, expressions = self.ts_bigger.to_sparse()
+        self.assertEqual(matrix.shape, (4, 4))
+        self.assertEqual(matrix[1, 2], 0.8)
+        self.assertEqual(matrix[3, 1], 0.9)
+        self.assertEqual(matrix[2, 1], 0)
+        self.assertTrue(np.isnan(matrix[2, 2]))
+        self.assertEqual(list(labels), [None] * 4 + ["r", None, None])
+        self.assertEqual(list(expressions), [None] * 4 + ["(k1)/(k1 + 2)", None, None])
+
+    def test_reachable_states(self):
+        self.ts_bigger.init = 1
+        self.assertEqual(self.ts_bigger.reachable_states(), {0, 1, 2, 3})
+        self.assertEqual(self.ts_bigger.reachable_states(2), {2})
@@ -1,7 +1,10 @@
 import collections
+import pickle
 import unittest
 
-from eBCSgen.Core.Complex import align_agents
+from sortedcontainers import SortedList
+
+from eBCSgen.Core.Complex import Complex, OrderingIndex, align_agents
 import Testing.objects_testing as objects
 
 
@@ -10,6 +13,15 @@ class TestComplex(unittest.TestCase):
         self.assertEqual(objects.c8, objects.c10)
         self.assertNotEqual(objects.c8, objects.c11)
 
+    def test_intern(self):
+        self.assertEqual(objects.c8.intern(), objects.c10.intern())
+        self.assertNotEqual(objects.c8.intern(), objects.c11.intern())
+        self.assertEqual(objects.c8 < objects.c11, repr(objects.c8) < repr(objects.c11))
+
+        copied = pickle.loads(pickle.dumps(objects.c8))
+        self.assertIsNone(copied.id)
+        self.assertEqual(copied, objects.c8)
+
     def test_print(self):
         self.assertEqual(str(objects.c8), "X(T{s}).A(S{i},U{a}).A(S{i},U{a})::cyt")
         self.assertEqual(str(objects.c9), "X(T{_}).A(S{i},U{_}).A(S{_},U{a})::cyt")
@@ -20,6 +32,18 @@ class TestComplex(unittest.TestCase):
         self.assertFalse(objects.c9.compatible(objects.c11))
         self.assertFalse(objects.large_c1.compatible(objects.large_c2))
 
+        species = Complex([objects.s9] * 6 + [objects.s8] * 6, "cell")
+        self.assertTrue(Complex([objects.s11] * 6 + [objects.s10] * 6, "cell").compatible(species))
+        self.assertFalse(Complex([objects.s11] * 7 + [objects.s10] * 5, "cell").compatible(species))
+
+    def test_ordering_index(self):
+        ordering = SortedList([objects.c8, objects.c11, objects.large_c2])
+        index = OrderingIndex(ordering)
+        self.assertEqual(index.compatible(objects.c9), [ordering.index(objects.c8)])
+        self.assertEqual(index.compatible(objects.c8), [ordering.index(objects.c8)])
+        self.assertEqual(index.compatible(objects.large_c1), [i for i, complex in enumerate(ordering)
+                                                               if objects.large_c1.compatible(complex)])
+
     def test_to_PRISM_code(self):
         self.assertEqual(objects.c8.to_PRISM_code(5), "VAR_5")
 
@@ -8,6 +8,7 @@ import numpy as np
 from eBCSgen.Core.Formula import Formula
 from eBCSgen.Core.Model import Model
 from eBCSgen.Core.Rate import Rate
+from eBCSgen.TS.MatchCache import MatchCache
 from eBCSgen.TS.State import Vector, State, Memory
 from eBCSgen.TS.VectorModel import VectorModel
 from eBCSgen.TS.VectorReaction import VectorReaction
@@ -91,6 +92,8 @@ class TestModel(unittest.TestCase):
 
         self.model_for_bound = get_model_str("model_for_bound")
 
+        self.model_with_observables = get_model_str("model_with_observables")
+
     def test_str(self):
         model = objects.model_parser.parse(self.model_str_1).data
         back_to_str = repr(model)
@@ -107,6 +110,29 @@ class TestModel(unittest.TestCase):
         model = objects.model_parser.parse(self.model_str_1).data
         self.assertTrue(model.to_vector_model() == self.vm_1)
 
+    def test_to_vector_model_reachable(self):
+        model = objects.model_parser.parse(self.model_str_2).data
+        full = model.to_vector_model()
+        reachable = model.to_vector_model(reachable=True)
+        self.assertEqual(len(reachable.ordering), 3)
+        self.assertTrue(set(reachable.ordering) < set(full.ordering))
+        self.assertEqual(len(reachable.vector_reactions), 1)
+
+        truncated = model.to_vector_model(bound=2, reachable=True, max_species=2)
+        self.assertEqual(len(truncated.ordering), 2)
+        self.assertEqual(len(truncated.vector_reactions), 0)
+
+    def test_to_vector_model_in_processes(self):
+        model = objects.model_parser.parse(self.model_str_2).data
+        serial = model.to_vector_model()
+        parallel = model.to_vector_model(processes=2)
+        self.assertEqual(parallel.ordering, serial.ordering)
+        self.assertEqual(parallel.vector_reactions, serial.vector_reactions)
+        self.assertEqual(parallel.init, serial.init)
+
+        reachable = model.to_vector_model(reachable=True, processes=2)
+        self.assertEqual(reachable.vector_reactions, model.to_vector_model(reachable=True).vector_reactions)
+
     def test_zooming_syntax(self):
         model_abstract = objects.model_parser.parse(self.model_with_complexes).data
         model_base = objects.model_parser.parse(self.model_without_complexes).data
@@ -229,3 +255,37 @@ class TestModel(unittest.TestCase):
         model.rules = rules
         ts = model.generate_direct_transition_system()
         self.assertEqual(ts.bound, 2)
+
+    def test_match_cache(self):
+        model = objects.model_parser.parse(get_model_str("model_for_matching")).data
+        ts = model.generate_direct_transition_system()
+        fresh = MatchCache(model.match_cache.rules, model.definitions)
+
+        def consumed(results):
+            # symmetric matches may differ in the order of agents, consumed complexes are the same
+            return [(result[0], {rule.reconstruct_complexes_from_match(match) for match in result[1]})
+                    if result else None for rule, result in zip(fresh.rules, results)]
+
+        for code, state in ts.states_encoding.items():
+            results = model.match_cache.compute(state)
+            self.assertEqual(consumed(results), consumed(fresh.compute(state)))
+            for edge in model.outgoing_edges(state, ts.bound):
+                if not edge.target.is_hell:
+                    model.match_cache.inherit(results, state, edge.target)
+                    self.assertEqual(consumed(model.match_cache.compute(edge.target)),
+                                     consumed(fresh.compute(edge.target)))
+
+    def test_network_free_simulation_recording(self):
+        model = objects.model_parser.parse(self.model_with_observables).data
+        self.assertEqual(set(model.observables), {"all", "act"})
+
+        result = model.network_free_simulation(2, step=0.5)
+        self.assertEqual(result["times"].tolist(), [0, 0.5, 1, 1.5, 2])
+        self.assertEqual(sorted(result.iloc[0].tolist()[1:]), [0, 10])
+        self.assertTrue(all(result.iloc[:, 1:].sum(axis=1) == 10))
+
+        result = model.network_free_simulation(2, times=[3, 0, 1], observables=True)
+        self.assertEqual(list(result.columns), ["times", "all", "act"])
+        self.assertEqual(result["times"].tolist(), [0, 1, 3])
+        self.assertEqual(result["all"].tolist(), [10, 10, 10])
+        self.assertEqual(result["act"][0], 0)
@@ -1,3 +1,4 @@
+import pickle
 import unittest
 import numpy as np
 import sympy
@@ -58,6 +59,43 @@ class TestRate(unittest.TestCase):
         self.rate_2.vectorize(ordering, dict())
         self.assertEqual(self.rate_2.evaluate(objects.state2), sympy.sympify("3*4.0 + 2"))
 
+    def test_evaluate_compiled(self):
+        ordering = (objects.c15, objects.c16)
+        self.rate_1.vectorize(ordering, dict())
+        self.assertEqual(self.rate_1.params, {sympy.Symbol("v_1")})
+        self.assertEqual(self.rate_1.evaluate(objects.state1), sympy.sympify("7.5*v_1"))
+
+        self.rate_3.vectorize(ordering, {"v_1": 5})
+        self.assertEqual(self.rate_3.params, set())
+        self.assertEqual(type(self.rate_3.evaluate(objects.state1)), float)
+        self.assertAlmostEqual(self.rate_3.evaluate(objects.state1), 1.5)
+
+        # 0/0 is not simplified away
+        rate = Rate(objects.rate_parser.parse("[K()::cyt]/[K()::cyt]").data)
+        rate.vectorize(ordering, dict())
+        self.assertIsNone(rate.evaluate(State(Vector(np.array([0, 0])), Memory(0))))
+
+        # compiled function is not pickled
+        copied = pickle.loads(pickle.dumps(self.rate_3))
+        self.assertEqual(copied.evaluate(objects.state1), self.rate_3.evaluate(objects.state1))
+
+    def test_evaluate_batch(self):
+        ordering = (objects.c15, objects.c16)
+        rate = Rate(objects.rate_parser.parse("3.0/[K()::cyt]").data)
+        rate.vectorize(ordering, dict())
+
+        # zero denominator gives the same result in both paths
+        values = np.array([[0, 0], [1, 3]])
+        batch = rate.evaluate_batch(values)
+        self.assertEqual(list(batch), [rate.evaluate(State(Vector(row), Memory(0))) for row in values])
+        self.assertEqual(batch[0], sympy.zoo)
+        self.assertAlmostEqual(batch[1], 0.75)
+
+        rate = Rate(objects.rate_parser.parse("[K()::cyt]/[K()::cyt]").data)
+        rate.vectorize(ordering, dict())
+        self.assertEqual(list(rate.evaluate_batch(values)), [None, 1.0])
+        self.assertEqual(rate.evaluate_batch(values[1:]).dtype, float)
+
     def test_to_symbolic(self):
         ordering = (objects.c15, objects.c16)
         self.rate_1.vectorize(ordering, dict())
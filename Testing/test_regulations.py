@@ -1,6 +1,12 @@
+import itertools
+import os
+import tempfile
 import unittest
 
-from eBCSgen.Parsing.ParseBCSL import Parser
+import regex
+
+from eBCSgen.Parsing.ParseBCSL import Parser, load_TS_from_binary
+from eBCSgen.Regulations.Automaton import Automaton
 from Testing.models.get_model_str import get_model_str
 
 
@@ -75,6 +81,91 @@ class TestRegulations(unittest.TestCase):
 
         self.assertEqual(direct_ts, indirect_ts)
 
+    def test_regular_automaton(self):
+        labels = ["a", "b", "ab", "r1_S", "r1_T", "r2", ";", "1"]
+        for pattern in ["(r1_S;r1_T;r2|r1_T;r1_S;r2)", "(ab)*a?", "a(b|[0-9])+?r\\w{1,2}", "(ab){2}b*"]:
+            automaton = Automaton(pattern)
+            for length in range(4):
+                for path in itertools.product(labels, repeat=length):
+                    state = automaton.initial
+                    for label in path:
+                        state = automaton.step(state, label) if state is not None else None
+                    expected = regex.fullmatch(pattern, "".join(path), partial=True) is not None
+                    self.assertEqual(state is not None, expected)
+
+        self.assertRaises(ValueError, Automaton, "a*+b")
+
+    def test_regular_memory(self):
+        model = self.model_parser.parse(get_model_str("model_with_cycle") + get_model_str("regulation7")).data
+        self.assertEqual(model.regulation.memory, 3)
+
+        direct_ts = model.generate_direct_transition_system()
+        direct_ts.change_to_vector_backend()
+
+        indirect_ts = model.to_vector_model().generate_transition_system(max_size=100)
+        # states with equivalent histories are merged
+        self.assertEqual(len(indirect_ts.states_encoding), 3)
+        self.assertEqual(direct_ts, indirect_ts)
+
+    def test_regular_processes(self):
+        regulation = get_model_str("regulation5")
+
+        model = self.model_parser.parse(self.model_with_labels + regulation).data
+
+        direct_ts = model.generate_direct_transition_system(processes=2)
+        direct_ts.change_to_vector_backend()
+
+        vm = model.to_vector_model()
+        indirect_ts = vm.generate_transition_system(processes=2)
+
+        self.assertEqual(direct_ts, indirect_ts)
+
+    def test_save_to_binary(self):
+        for regulation in ["regulation1", "regulation2", "regulation5"]:
+            model = self.model_parser.parse(self.model_with_labels + get_model_str(regulation)).data
+
+            direct_ts = model.generate_direct_transition_system()
+            direct_ts.change_to_vector_backend()
+
+            generated_ts = model.to_vector_model().generate_transition_system()
+            with tempfile.TemporaryDirectory() as directory:
+                binary_file = os.path.join(directory, "testing_ts.bin")
+                generated_ts.save_to_binary(binary_file)
+                loaded_ts = load_TS_from_binary(binary_file)
+
+                # histories of states are kept
+                self.assertEqual(loaded_ts.states_encoding.memory, model.regulation.memory)
+                for code in generated_ts.states_encoding:
+                    self.assertEqual(loaded_ts.states_encoding[code], generated_ts.states_encoding[code])
+                self.assertEqual(direct_ts, loaded_ts)
+
+    def test_checkpoint(self):
+        for regulation in ["regulation1", "regulation5"]:
+            model = self.model_parser.parse(self.model_with_labels + get_model_str(regulation)).data
+            vector_model = model.to_vector_model()
+
+            direct_ts = model.generate_direct_transition_system()
+            direct_ts.change_to_vector_backend()
+
+            with tempfile.TemporaryDirectory() as directory:
+                checkpoint_file = os.path.join(directory, "checkpoint.bin")
+                for processes in [None, 2]:
+                    vector_model.generate_transition_system(max_size=2, processes=processes,
+                                                            checkpoint_file=checkpoint_file)
+                    checkpoint_ts = load_TS_from_binary(checkpoint_file)
+                    self.assertTrue(checkpoint_ts.unprocessed)
+
+                    generated_ts = vector_model.generate_transition_system(checkpoint_ts)
+                    self.assertEqual(direct_ts, generated_ts)
+
+        # TS without histories cannot be continued with a regulation
+        model = self.model_parser.parse(self.model_with_labels).data
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_file = os.path.join(directory, "checkpoint.bin")
+            model.to_vector_model().generate_transition_system(max_size=2, checkpoint_file=checkpoint_file)
+            checkpoint_ts = load_TS_from_binary(checkpoint_file)
+            self.assertRaises(ValueError, vector_model.generate_transition_system, checkpoint_ts)
+
     def test_no_regulation(self):
         model = self.model_parser.parse(self.model_with_labels).data
 
@@ -1,6 +1,11 @@
+import collections
+import pickle
+import random
 import unittest
+from sortedcontainers import SortedList
 
 from eBCSgen.Core.Rule import Rule
+from eBCSgen.TS.State import State, Multiset, Memory
 
 import Testing.objects_testing as objects
 
@@ -10,6 +15,63 @@ class TestRule(unittest.TestCase):
     def test_eq(self):
         self.assertEqual(objects.r4, objects.r4)
 
+    def test_hash(self):
+        rule = objects.rule_parser.parse("K(S{u})::cyt => K(S{p})::cyt @ 3*[K()::cyt]").data[1]
+        rules = {rule}
+        rule.comment = (True, [1])
+        complex = objects.rate_complex_parser.parse("K()::cyt").data.children[0]
+        rule.rate_to_vector(SortedList([complex]), {})
+        self.assertIn(rule, rules)
+        self.assertEqual(hash(rule), hash(pickle.loads(pickle.dumps(rule))))
+
+    def test_match(self):
+        rule = objects.rule_parser.parse("K(S{_})::cyt + K(S{_})::cyt => K(S{_}).K(S{_})::cyt").data[1]
+        rule.lhs, rule.rhs = rule.create_complexes()
+        unphosphorylated = objects.rate_complex_parser.parse("K(S{u})::cyt").data.children[0]
+        phosphorylated = objects.rate_complex_parser.parse("K(S{p})::cyt").data.children[0]
+
+        counter = collections.Counter({unphosphorylated: 2, phosphorylated: 1})
+        state = State(Multiset(counter), Memory(0))
+        matches = rule.match(state, all=True)
+        self.assertEqual(len(matches), 3)
+        self.assertEqual(state.content.value, collections.Counter({unphosphorylated: 2, phosphorylated: 1}))
+
+        random.seed(10)
+        for _ in range(10):
+            self.assertIn(rule.match(state), matches)
+
+        state = State(Multiset(collections.Counter({phosphorylated: 1})), Memory(0))
+        self.assertIsNone(rule.match(state, all=True))
+        self.assertIsNone(rule.match(state))
+
+    def test_match_distribution(self):
+        rule = objects.rule_parser.parse("K(S{_})::cyt + K(S{_})::cyt => K(S{_}).K(S{_})::cyt").data[1]
+        rule.lhs, rule.rhs = rule.create_complexes()
+        unphosphorylated = objects.rate_complex_parser.parse("K(S{u})::cyt").data.children[0]
+        phosphorylated = objects.rate_complex_parser.parse("K(S{p})::cyt").data.children[0]
+        state = State(Multiset(collections.Counter({unphosphorylated: 3, phosphorylated: 2})), Memory(0))
+
+        # mass action: C(3, 2) : 3 * 2 : C(2, 2)
+        expected = {("K(S{u})", "K(S{u})"): 0.3, ("K(S{p})", "K(S{u})"): 0.6, ("K(S{p})", "K(S{p})"): 0.1}
+        picked = {tuple(sorted(map(str, match))) for match in rule.match(state, all=True)}
+        self.assertEqual(picked, set(expected))
+
+        random.seed(10)
+        samples = 20000
+        frequencies = collections.Counter(tuple(sorted(map(str, rule.match(state)))) for _ in range(samples))
+        for match, probability in expected.items():
+            self.assertAlmostEqual(frequencies[match] / samples, probability, delta=0.015)
+
+    def test_apply(self):
+        rule = objects.rule_parser.parse("K(S{_})::cyt + K(S{_})::cyt => K(S{_}).K(S{_})::cyt").data[1]
+        match = [objects.rate_complex_parser.parse(agent).data.children[0].agents[0]
+                 for agent in ["K(S{u})::cyt", "K(S{p})::cyt"]]
+
+        consumed, produced = rule.apply(match)
+        self.assertEqual(consumed, rule.reconstruct_complexes_from_match(match))
+        self.assertEqual(produced, rule.replace(match))
+        self.assertIs(rule.apply(list(match))[1], produced)
+
     def test_print(self):
         self.assertEqual(str(objects.r4), "K(S{u}).B()::cyt => K(S{p})::cyt + B()::cyt @ 3.0*[K()::cyt]/2.0*v_1")
         self.assertEqual(str(objects.r5),
@@ -43,6 +105,12 @@ class TestRule(unittest.TestCase):
 
         self.assertEqual(result, reactions)
 
+        rule = objects.rule_parser.parse(rule_exp).data[1]
+        generated = rule.generate_reactions(atomic_signature, structure_signature)
+        first = next(generated)
+        self.assertIs(first.rate, rule.rate)
+        self.assertEqual({first} | set(generated), reactions)
+
     def test_compatible(self):
         self.assertTrue(objects.r4.compatible(objects.r5))
         self.assertFalse(objects.r5.compatible(objects.r4))
@@ -1,3 +1,6 @@
+import multiprocessing
+import os
+import tempfile
 import unittest
 import numpy as np
 import pandas as pd
@@ -6,8 +9,9 @@ from eBCSgen.Core.Atomic import AtomicAgent
 from eBCSgen.Core.Rate import Rate
 from eBCSgen.Core.Structure import StructureAgent
 from eBCSgen.Core.Complex import Complex
-from eBCSgen.Parsing.ParseBCSL import Parser, load_TS_from_json
+from eBCSgen.Parsing.ParseBCSL import Parser, load_TS_from_json, load_TS_from_binary
 from eBCSgen.TS.Edge import Edge
+from eBCSgen.TS.Simulation import SSA, Statistics, NextReactionMethod, TauLeaping, IndexedPriorityQueue
 from eBCSgen.TS.State import State, Vector, Memory
 from eBCSgen.TS.TransitionSystem import TransitionSystem
 from eBCSgen.TS.VectorModel import VectorModel
@@ -103,8 +107,6 @@ class TestVectorModel(unittest.TestCase):
         gob = gamma + omega + beta  # 10
         oa = omega + alpha  # 13
 
-        self.test_ts.states = set(states)
-
         self.test_ts.edges = {Edge(states[0], states[1], gamma / go), Edge(states[0], states[3], omega / go),
                               Edge(states[1], states[2], omega / omega),
                               Edge(states[2], states[4], omega / oa), Edge(states[2], states[8], alpha / oa),
@@ -141,6 +143,36 @@ class TestVectorModel(unittest.TestCase):
     def test_compute_bound(self):
         self.assertEqual(self.vm_1.bound, 2)
 
+    def test_compile_reactions(self):
+        self.assertEqual(self.vm_1.reactants.shape, (3, 3))
+        for reaction, reactants, delta in zip(self.vm_1.reactions, self.vm_1.reactants, self.vm_1.delta):
+            np.testing.assert_array_equal(reactants, reaction.source.content.value)
+            np.testing.assert_array_equal(reactants + delta, reaction.target.content.value)
+
+    def test_propensities(self):
+        values = np.array([[2.0, 1.0, 1.0], [0.0, 3.0, 0.0]])
+        rates = self.vm_2.propensities(values)
+        self.assertEqual(rates.shape, (2, 3))
+        for row, state in zip(rates, values):
+            state = State(Vector(state), Memory(0))
+            for rate, reaction in zip(row, self.vm_2.reactions):
+                if reaction.match(state):
+                    self.assertAlmostEqual(rate, reaction.evaluate_rate(state, None))
+                else:
+                    self.assertEqual(rate, 0)
+
+    def test_outgoing_edges_batch(self):
+        # rate with zero denominator in the initial state
+        model_zero_division = "#! rules\nX()::rep => Y()::rep @ 1/[Y()::rep]\nY()::rep => X()::rep @ 2\n" \
+                              "#! inits\n2 X()::rep"
+        for model_str in [self.model_bigger_TS, self.model_parametrised, model_zero_division]:
+            vector_model = self.model_parser.parse(model_str).data.to_vector_model()
+            ts = vector_model.generate_transition_system()
+            states = [ts.states_encoding[code] for code in ts.states_encoding]
+            batch = vector_model.outgoing_edges_batch(states, ts.bound)
+            for state, edges in zip(states, batch):
+                self.assertEqual(set(edges), set(vector_model.outgoing_edges(state, ts.bound)))
+
     def test_deterministic_simulation(self):
         # simple rates
         data_simulated = self.vm_2.deterministic_simulation(3, 1/(6.022 * 10**23))
@@ -161,9 +193,121 @@ class TestVectorModel(unittest.TestCase):
         model = self.model_parser.parse(self.model_abstract).data
         vector_model = model.to_vector_model()
 
-        data_simulated = vector_model.stochastic_simulation(5, 4, testing=True)
+        # reference of the original implementation (fixed time step 0.1), mean of 4 runs weighted
+        # by 1/8, 1/8, 1/4 and 1/2, its standard deviation is sqrt(0.34375) of the deviation of a run
         data_loaded = pd.read_csv("Testing/stochastic_out.csv")
-        pd.testing.assert_frame_equal(data_simulated, data_loaded)
+        data_simulated = vector_model.stochastic_simulation(5, 2000, testing=True, step=0.1, variance=True)
+        np.testing.assert_allclose(data_simulated["times"], data_loaded["times"])
+
+        for column in data_loaded.columns[1:]:
+            deviation = np.sqrt(0.34375 * data_simulated["var({})".format(column)])
+            self.assertTrue(np.all(np.abs(data_simulated[column] - data_loaded[column]) <= 4 * deviation + 1e-9))
+
+    def test_ssa(self):
+        model = self.model_parser.parse(self.model_abstract).data
+        ssa = SSA(model.to_vector_model())
+        np.testing.assert_array_equal(ssa.propensities(ssa.init), [1.2, 0.5])
+
+        times = np.arange(0, 20, 0.5)
+        states = ssa.sample(times, np.random.default_rng(5))
+        self.assertEqual(states.shape, (len(times), 3))
+        self.assertEqual(states[:, :2].sum(axis=1).tolist(), [10] * len(times))
+        self.assertTrue(np.all(np.diff(states[:, 2]) >= 0))
+        np.testing.assert_array_equal(ssa.sample(times, np.random.default_rng(5)), states)
+
+        # no reaction can be used, the state is kept forever
+        ssa.init = np.array([0, 0, 0])
+        ssa.propensities = lambda values: np.zeros(2)
+        np.testing.assert_array_equal(ssa.sample(times, np.random.default_rng(5)), np.zeros((len(times), 3)))
+
+    def test_statistics(self):
+        samples = np.random.default_rng(1).random((7, 2, 3))
+        statistics, first, second = Statistics((2, 3)), Statistics((2, 3)), Statistics((2, 3))
+        for i, sample in enumerate(samples):
+            statistics.add(sample)
+            (first if i < 3 else second).add(sample)
+        first.merge(second)
+
+        for result in [statistics, first]:
+            self.assertEqual(result.count, 7)
+            np.testing.assert_allclose(result.mean, samples.mean(axis=0))
+            np.testing.assert_allclose(result.variance, samples.var(axis=0, ddof=1))
+
+    def test_stochastic_simulation_ensemble(self):
+        model = self.model_parser.parse(self.model_abstract).data
+        vector_model = model.to_vector_model()
+
+        serial = vector_model.stochastic_simulation(2, 12, step=0.5, seed=3, variance=True)
+        self.assertEqual(list(serial.columns), ["times", "T{a}::rep", "T{i}::rep", "X()::rep",
+                                                "var(T{a}::rep)", "var(T{i}::rep)", "var(X()::rep)"])
+        self.assertEqual(serial["times"].tolist(), [0, 0.5, 1, 1.5, 2])
+        parallel = vector_model.stochastic_simulation(2, 12, step=0.5, seed=3, processes=2, variance=True)
+        pd.testing.assert_frame_equal(serial, parallel)
+
+    def test_stochastic_simulation_observables(self):
+        model = self.model_parser.parse(get_model_str("model_with_observables")).data
+        vector_model = model.to_vector_model()
+
+        result = vector_model.stochastic_simulation(2, 5, seed=1, times=[2, 0, 1], observables=True)
+        self.assertEqual(list(result.columns), ["times", "all", "act"])
+        self.assertEqual(result["times"].tolist(), [0, 1, 2])
+        self.assertEqual(result["all"].tolist(), [10, 10, 10])
+
+        species = vector_model.stochastic_simulation(2, 5, seed=1, times=[0, 1, 2])
+        active = species[str(vector_model.ordering[0])]
+        self.assertEqual(vector_model.ordering[0], model.observables["act"].get_params_and_agents()[0].pop())
+        self.assertTrue(all(result["act"] >= active ** 2))
+
+    def test_next_reaction_method(self):
+        model = self.model_parser.parse(self.model_abstract).data
+        engine = NextReactionMethod(model.to_vector_model())
+        # creation of X()::rep does not affect any rate, conversion of T affects both
+        self.assertEqual(engine.dependencies, [[0], [0, 1]])
+        self.assertEqual([engine.propensity(i, engine.init) for i in range(2)], engine.propensities(engine.init).tolist())
+
+        times = np.arange(0, 20, 0.5)
+        states = engine.sample(times, np.random.default_rng(5))
+        self.assertEqual(states[:, :2].sum(axis=1).tolist(), [10] * len(times))
+        np.testing.assert_array_equal(engine.sample(times, np.random.default_rng(5)), states)
+
+        model = self.model_parser.parse(get_model_str("model_with_observables")).data
+        vector_model = model.to_vector_model()
+        direct = vector_model.stochastic_simulation(10, 200, step=5, seed=1)
+        next_reaction = vector_model.stochastic_simulation(10, 200, step=5, seed=1, method="next_reaction")
+        np.testing.assert_allclose(next_reaction.values, direct.values, atol=0.5)
+
+    def test_tau_leaping(self):
+        model_str = get_model_str("model_with_observables").replace("10 A{i}::cell", "100000 A{i}::cell")
+        vector_model = self.model_parser.parse(model_str).data.to_vector_model()
+        engine = TauLeaping(vector_model)
+        rates = engine.propensities(engine.init)
+        self.assertFalse(engine.critical(engine.init, rates).any())
+        self.assertTrue(engine.critical(np.array([5, 5]), engine.propensities(np.array([5, 5]))).all())
+        self.assertAlmostEqual(engine.leap_bound(engine.init, rates, np.zeros(2, dtype=bool)), 1 / 50000)
+        values = np.array([50000, 50000])
+        self.assertAlmostEqual(engine.leap_bound(values, engine.propensities(values), np.zeros(2, dtype=bool)), 0.1)
+
+        result = vector_model.stochastic_simulation(10, 10, step=5, seed=1, method="tau_leaping", observables=True)
+        self.assertEqual(result["all"].tolist(), [100000] * 3)
+        expected = 100000 * 5 / 7 * (1 - np.exp(-7 * np.array([0, 5, 10]) / 10))
+        np.testing.assert_allclose(result["act"] ** 0.5, expected, rtol=0.01)
+
+        # low counts are simulated by exact steps
+        model = self.model_parser.parse(self.model_abstract).data
+        states = TauLeaping(model.to_vector_model()).sample(np.arange(0, 20, 0.5), np.random.default_rng(5))
+        self.assertEqual(states[:, :2].sum(axis=1).tolist(), [10] * 40)
+
+    def test_indexed_priority_queue(self):
+        keys = [5.0, 1.0, 3.0, np.inf]
+        queue = IndexedPriorityQueue(keys)
+        self.assertEqual(queue.top(), (1, 1.0))
+        queue.update(3, 0.5)
+        self.assertEqual(queue.top(), (3, 0.5))
+        queue.update(3, 4.0)
+        queue.update(1, 6.0)
+        self.assertEqual(queue.top(), (2, 3.0))
+        self.assertEqual([queue.position[item] for item in queue.heap], list(range(4)))
+        self.assertEqual(IndexedPriorityQueue([]).top(), (None, np.inf))
 
     def test_generate_transition_system(self):
         model = self.model_parser.parse(self.model_TS).data
@@ -179,6 +323,43 @@ class TestVectorModel(unittest.TestCase):
         loaded_ts = load_TS_from_json("Testing/testing_bigger_ts.json")
         self.assertEqual(generated_ts, loaded_ts)
 
+    def test_generate_transition_system_processes(self):
+        model = self.model_parser.parse(self.model_TS).data
+        vector_model = model.to_vector_model()
+        generated_ts = vector_model.generate_transition_system(processes=2)
+        self.assertEqual(self.test_ts, generated_ts)
+
+        model = self.model_parser.parse(self.model_bigger_TS).data
+        vector_model = model.to_vector_model()
+        generated_ts = vector_model.generate_transition_system(processes=2)
+        loaded_ts = load_TS_from_json("Testing/testing_bigger_ts.json")
+        self.assertEqual(generated_ts, loaded_ts)
+
+    def test_generate_transition_system_limits(self):
+        model = self.model_parser.parse(self.model_even_bigger_TS).data
+        vector_model = model.to_vector_model()
+
+        # each worker can finish its currently processed state
+        generated_ts = vector_model.generate_transition_system(max_size=100)
+        self.assertTrue(100 <= len(generated_ts.states_encoding) <
+                        100 + multiprocessing.cpu_count() * len(vector_model.vector_reactions))
+        self.assertTrue(generated_ts.unprocessed)
+
+        generated_ts = vector_model.generate_transition_system(max_time=0.1)
+        self.assertTrue(generated_ts.unprocessed)
+
+    def test_generate_transition_system_error(self):
+        model = self.model_parser.parse(self.model_even_bigger_TS).data
+        vector_model = model.to_vector_model()
+
+        def outgoing_edges(state, bound):
+            raise ZeroDivisionError("failed state")
+
+        # the error of a worker is raised instead of waiting forever
+        vector_model.outgoing_edges = outgoing_edges
+        with self.assertRaises(ZeroDivisionError):
+            vector_model.generate_transition_system()
+
     def test_save_to_json(self):
         model = self.model_parser.parse(self.model_TS).data
         vector_model = model.to_vector_model()
@@ -187,6 +368,45 @@ class TestVectorModel(unittest.TestCase):
         loaded_ts = load_TS_from_json("Testing/testing_ts.json")
         self.assertEqual(generated_ts, loaded_ts)
 
+    def test_save_to_binary(self):
+        with tempfile.TemporaryDirectory() as directory:
+            binary_file = os.path.join(directory, "testing_ts.bin")
+            for model_str in [self.model_TS, self.model_parametrised]:
+                vector_model = self.model_parser.parse(model_str).data.to_vector_model()
+                generated_ts = vector_model.generate_transition_system()
+                generated_ts.save_to_binary(binary_file)
+                loaded_ts = load_TS_from_binary(binary_file)
+                self.assertEqual(generated_ts, loaded_ts)
+                self.assertEqual(loaded_ts.init, generated_ts.init)
+
+            # interrupted TS can be continued
+            vector_model = self.model_parser.parse(self.model_even_bigger_TS).data.to_vector_model()
+            generated_ts = vector_model.generate_transition_system(max_size=1000)
+            generated_ts.save_to_binary(binary_file)
+            loaded_unfinished_ts = load_TS_from_binary(binary_file)
+            self.assertEqual(loaded_unfinished_ts.unprocessed, generated_ts.unprocessed)
+
+            generated_ts = vector_model.generate_transition_system(loaded_unfinished_ts)
+            loaded_ts = load_TS_from_json("Testing/interrupt_even_bigger_ts.json")
+            self.assertEqual(generated_ts, loaded_ts)
+
+    def test_checkpoint(self):
+        vector_model = self.model_parser.parse(self.model_even_bigger_TS).data.to_vector_model()
+        loaded_ts = load_TS_from_json("Testing/interrupt_even_bigger_ts.json")
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_file = os.path.join(directory, "checkpoint.bin")
+            for processes in [None, 2]:
+                generated_ts = vector_model.generate_transition_system(max_size=2000, processes=processes,
+                                                                       checkpoint_file=checkpoint_file,
+                                                                       checkpoint_size=500)
+                checkpoint_ts = load_TS_from_binary(checkpoint_file)
+                self.assertEqual(len(checkpoint_ts.states_encoding), len(generated_ts.states_encoding))
+                self.assertEqual(checkpoint_ts.unprocessed, generated_ts.unprocessed)
+
+                generated_ts = vector_model.generate_transition_system(checkpoint_ts)
+                self.assertEqual(generated_ts, loaded_ts)
+
     def test_generate_pMC(self):
         model = self.model_parser.parse(self.model_parametrised).data
         vector_model = model.to_vector_model()
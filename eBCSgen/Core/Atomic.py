@@ -1,7 +1,11 @@
+from eBCSgen.Core.Interning import AGENTS
+
+
 class AtomicAgent:
     def __init__(self, name: str, state: str):
         self.name = name
         self.state = state
+        self.id = None  # see intern()
 
     def __repr__(self):
         return str(self)
@@ -15,10 +19,26 @@ class AtomicAgent:
     def __eq__(self, other: 'AtomicAgent'):
         if type(self) != type(other):
             return False
-        return self.name == other.name and self.state == other.state
+        return self.intern() == other.intern()
 
     def __hash__(self):
-        return hash(str(self))
+        return self.intern()
+
+    def __getstate__(self):
+        # IDs are valid only in the current process
+        state = self.__dict__.copy()
+        state['id'] = None
+        return state
+
+    def intern(self) -> int:
+        """
+        Obtains integer ID of the agent, equal agents have the same ID.
+
+        :return: ID from the table of agents
+        """
+        if self.id is None:
+            self.id = AGENTS.intern(('atomic', self.name, self.state), self.__str__)
+        return self.id
 
     def compatible(self, other: 'AtomicAgent') -> bool:
         """
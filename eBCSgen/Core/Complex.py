@@ -1,14 +1,19 @@
 import collections
 import itertools
-from copy import deepcopy
 
 from eBCSgen.Core.Atomic import AtomicAgent
+from eBCSgen.Core.Interning import COMPLEXES, BoundedCache
+
+# results of compatible() and align_match() for pairs of IDs of complexes
+COMPATIBILITY = BoundedCache(2 ** 16)
+ALIGNMENTS = BoundedCache(2 ** 14)
 
 
 class Complex:
     def __init__(self, agents: list, compartment: str):
         self.agents = agents
         self.compartment = compartment
+        self.id = None  # see intern()
 
     def __repr__(self):
         return ".".join(sorted(list(map(str, self.agents)))) + "::" + self.compartment
@@ -17,14 +22,42 @@ class Complex:
         return ".".join(list(map(str, self.agents))) + "::" + self.compartment
 
     def __lt__(self, other: 'Complex'):
-        return repr(self) < repr(other)
+        return COMPLEXES.sort_keys[self.intern()] < COMPLEXES.sort_keys[other.intern()]
 
     def __eq__(self, other: 'Complex'):
-        return self.compartment == other.compartment and\
-               collections.Counter(self.agents) == collections.Counter(other.agents)
+        return self.intern() == other.intern()
 
     def __hash__(self):
-        return hash((frozenset(collections.Counter(self.agents).items()), self.compartment))
+        return self.intern()
+
+    def __getstate__(self):
+        # IDs are valid only in the current process
+        state = self.__dict__.copy()
+        state['id'] = None
+        return state
+
+    def intern(self) -> int:
+        """
+        Obtains integer ID of the complex, equal complexes have the same ID.
+
+        The canonical form of the complex is its compartment and sorted IDs of its agents
+        (agents are treated as a multiset). Its repr is used for ordering of complexes.
+
+        :return: ID from the table of complexes
+        """
+        if self.id is None:
+            agents = collections.Counter(self.agents).elements()
+            form = (self.compartment, tuple(sorted(agent.intern() for agent in agents)))
+            self.id = COMPLEXES.intern(form, self.__repr__)
+        return self.id
+
+    def group_key(self) -> tuple:
+        """
+        Compatible complexes have the same compartment and the same names of agents.
+
+        :return: key shared by all complexes compatible with this one
+        """
+        return self.compartment, tuple(sorted(agent.name for agent in collections.Counter(self.agents).elements()))
 
     def get_atomic_names(self) -> set:
         """
@@ -93,22 +126,24 @@ class Complex:
         """
         Checks whether two Complexes are compatible.
 
+        Agents of the complexes have to be paired one-to-one so that each agent of self
+        is compatible with its pair. Such pairing is a perfect matching in the bipartite
+        graph of compatible agents, which is found by augmenting paths (see match_agents).
+        Results are cached for pairs of IDs of the complexes.
+
         :param other: another Complex
         :return: True if they are compatible
         """
         if type(self) != type(other):
             return False
-        if self == other:
-            return True
-        self_agents = collections.Counter(self.agents)
-        other_agents = collections.Counter(other.agents)
-        if self.compartment == other.compartment and sum(self_agents.values()) == sum(other_agents.values()):
-            other_permutations = list(itertools.permutations(list(other_agents.elements())))
-            for self_perm in itertools.permutations(list(self_agents.elements())):
-                for other_perm in other_permutations:
-                    if all([self_perm[i].compatible(other_perm[i]) for i in range(len(self_perm))]):
-                        return True
-        return False
+        key = (self.intern(), other.intern())
+        result = COMPATIBILITY.get(key)
+        if result is None:
+            result = self.compartment == other.compartment and \
+                     (key[0] == key[1] or match_agents(list(collections.Counter(self.agents).elements()),
+                                                       list(collections.Counter(other.agents).elements())))
+            COMPATIBILITY.add(key, result)
+        return result
 
     def identify_compatible(self, agents: tuple) -> list:
         """
@@ -154,10 +189,71 @@ class Complex:
         Align self.agents based on given order.
         An alignment must exist (because respective complex is compatible)
 
+        Results are cached for pairs of IDs of the complexes and must not be modified.
+
         :param complex: given reference (from lhs) complex
         :return: aligned self.agents
         """
-        return align_agents(complex.agents, collections.Counter(self.agents))
+        key = (self.intern(), complex.intern())
+        result = ALIGNMENTS.get(key)
+        if result is None:
+            result = align_agents(complex.agents, collections.Counter(self.agents))
+            ALIGNMENTS.add(key, result)
+        return result
+
+
+class OrderingIndex:
+    """
+    Index of an ordering of Complexes, used to find complexes compatible with a pattern.
+
+    Complexes are grouped by their group_key, so only the group of the pattern is checked
+    instead of the whole ordering. Results are kept for each pattern.
+    """
+    def __init__(self, ordering):
+        self.ordering = ordering
+        self.groups = collections.defaultdict(list)  # group key -> indices
+        for i, complex in enumerate(ordering):
+            self.groups[complex.group_key()].append(i)
+        self.indices = dict()  # ID of pattern -> indices
+
+    def compatible(self, pattern: Complex) -> list:
+        """
+        :param pattern: given Complex
+        :return: indices of complexes in the ordering compatible with the pattern
+        """
+        key = pattern.intern()
+        if key not in self.indices:
+            self.indices[key] = [i for i in self.groups.get(pattern.group_key(), [])
+                                 if pattern.compatible(self.ordering[i])]
+        return self.indices[key]
+
+
+def match_agents(patterns: list, agents: list) -> bool:
+    """
+    Decides whether there is a one-to-one pairing of patterns with agents
+    such that each pattern is compatible with its agent.
+
+    Uses augmenting paths (Kuhn's algorithm), compatibility of each pair is checked at most once.
+
+    :param patterns: agents of the pattern complex
+    :param agents: agents of the other complex
+    :return: True if such a pairing exists
+    """
+    if len(patterns) != len(agents):
+        return False
+    edges = [[j for j, agent in enumerate(agents) if pattern.compatible(agent)] for pattern in patterns]
+    paired = [None] * len(agents)  # agent -> its pattern
+
+    def augment(i, visited):
+        for j in edges[i]:
+            if j not in visited:
+                visited.add(j)
+                if paired[j] is None or augment(paired[j], visited):
+                    paired[j] = i
+                    return True
+        return False
+
+    return all(augment(i, set()) for i in range(len(patterns)))
 
 
 def align_agents(ordered, to_align):
@@ -172,9 +268,10 @@ def align_agents(ordered, to_align):
     if len(ordered) == 0:
         return [choices]
     for agent in list(to_align):
-        if ordered[0].compatible(agent):
-            new_to_align = deepcopy(to_align)
-            new_to_align[agent] -= 1
-            for branch in align_agents(ordered[1:], +new_to_align):
+        # counts are changed in place and restored afterwards
+        if to_align[agent] > 0 and ordered[0].compatible(agent):
+            to_align[agent] -= 1
+            for branch in align_agents(ordered[1:], to_align):
                 choices.append([agent] + branch)
+            to_align[agent] += 1
     return choices
@@ -0,0 +1,66 @@
+import threading
+
+
+class InternTable:
+    """
+    Assigns small integer IDs to canonical forms of objects.
+
+    Equal objects have the same canonical form and therefore the same ID, so equality
+    and hashing can be done on the IDs. For each ID also a sort key of its first
+    representative is kept, which is used to order the objects.
+
+    IDs are valid only within a single process.
+    """
+    def __init__(self):
+        self.ids = dict()  # canonical form -> ID
+        self.sort_keys = []  # ID -> sort key
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sort_keys)
+
+    def intern(self, form, sort_key) -> int:
+        """
+        :param form: hashable canonical form
+        :param sort_key: function computing sort key (called only for a new form)
+        :return: ID of given form
+        """
+        id = self.ids.get(form)
+        if id is None:
+            with self.lock:
+                id = self.ids.get(form)
+                if id is None:
+                    id = len(self.sort_keys)
+                    self.sort_keys.append(sort_key())
+                    self.ids[form] = id
+        return id
+
+
+class BoundedCache:
+    """
+    Thread-safe memo of results with limited size, the oldest entries are removed first.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.results = dict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.results.pop(key, default)
+
+    def add(self, key, result):
+        with self.lock:
+            if len(self.results) >= self.size:
+                del self.results[next(iter(self.results))]
+            self.results[key] = result
+
+
+AGENTS = InternTable()
+COMPLEXES = InternTable()
@@ -1,7 +1,6 @@
 import collections
-import multiprocessing
+import itertools
 import random
-import time
 import numpy as np
 from lark import Tree
 import pandas as pd
@@ -11,24 +10,34 @@ import libsbml
 
 from eBCSgen.Regulations.Conditional import Conditional, VectorConditional
 from eBCSgen.Core.Atomic import AtomicAgent
-from eBCSgen.Core.Complex import Complex
+from eBCSgen.Core.Complex import Complex, OrderingIndex
 from eBCSgen.Core.Rate import Rate
+from eBCSgen.Core.Rule import find_all_matches
 from eBCSgen.Core.Side import Side
+from eBCSgen.Core.Vectorization import vectorize_rule, vectorize_in_processes, create_ordering_in_processes
+from eBCSgen.TS.MatchCache import MatchCache
+from eBCSgen.TS.Simulation import to_float
 from eBCSgen.TS.TransitionSystem import TransitionSystem
-from eBCSgen.TS.State import State, Memory, Multiset
-from eBCSgen.TS.TSworker import TSworker
-from eBCSgen.TS.VectorModel import VectorModel, handle_number_of_threads
+from eBCSgen.TS.State import State, Memory, Multiset, Vector
+from eBCSgen.TS.StateStore import StateStore
+from eBCSgen.TS.TSworker import generate_in_threads, process_state
+from eBCSgen.TS.TSprocessing import generate_in_processes
+from eBCSgen.TS.VectorModel import VectorModel
+from eBCSgen.TS.VectorReaction import VectorReaction
 from eBCSgen.Export.ModelSBML import ModelSBML
 
 
 class Model:
-    def __init__(self, rules: set, init: collections.Counter, definitions: dict, params: set, regulation=None):
+    def __init__(self, rules: set, init: collections.Counter, definitions: dict, params: set, regulation=None,
+                 observables: dict = None):
         self.rules = rules  # set of Rules
         self.init = init  # Counter: Complex -> int
         self.definitions = definitions  # dict str -> float
         self.params = params  # set of str
         self.all_rates = self.check_rates()  # indicates whether model is quantitative
         self.regulation = regulation  # used to rules filtering, can be unspecified (None)
+        self.observables = observables if observables else dict()  # dict str -> Rate (expression of complexes)
+        self.match_cache = None  # MatchCache used in direct TS generation
         
         # autocomplete
         self.atomic_signature, self.structure_signature = self.extract_signatures()
@@ -82,42 +91,71 @@ class Model:
                 atomic_signature[name] = {"_"}
         return atomic_signature, structure_signature
 
-    def create_ordering(self) -> SortedList:
+    def create_ordering(self, processes: int = None) -> SortedList:
         """
         Extracts all possible unique agents from the model and gives them fixed order using SortedList.
 
+        :param processes: number of worker processes collecting complexes of rules (serial if not given)
         :return: SortedList of unique agents
         """
-        unique_complexes = set()
-        for rule in self.rules:
-            unique_complexes |= rule.create_all_compatible(self.atomic_signature, self.structure_signature)
+        if processes:
+            unique_complexes = create_ordering_in_processes(self, processes)
+        else:
+            unique_complexes = set()
+            for rule in self.rules:
+                unique_complexes |= rule.create_all_compatible(self.atomic_signature, self.structure_signature)
 
         unique_complexes |= set(self.init)
         return SortedList(unique_complexes)
 
-    def to_vector_model(self, bound: int = None) -> VectorModel:
+    def to_vector_model(self, bound: int = None, reachable: bool = False,
+                        max_species: float = np.inf, processes: int = None) -> VectorModel:
         """
         Creates vector representation of the model.
 
-        First reactions are generated, then unique complexes are collected and finally both reactions and
-        initial state are transformed to vector representation.
+        First unique complexes are collected, then reactions are generated one at a time, transformed
+        to vector representation and deduplicated, so the reactions of a rule are never all kept
+        in memory at once. Reactions of a rule share its compiled rate.
+
+        If reachable is set, only the reaction network reachable from the initial state is created
+        (see generate_network) instead of all reactions compatible with the signatures.
+
+        If processes are given, rules are vectorized in a pool of worker processes (one rule per task)
+        and the results are merged in the order of rules, so the result is the same as the serial one.
 
         :param bound: given bound
+        :param reachable: create only reachable reactions and complexes
+        :param max_species: maximal number of complexes in the reachable network
+        :param processes: number of worker processes (serial if not given)
         :return: VectorModel representation of the model
         """
-        ordering = self.create_ordering()
-        reactions = set()
+        network = None
+        if reachable:
+            ordering, network = self.generate_network(max_species)
+            if type(self.regulation) == Conditional:
+                # complexes of the regulation might not be reachable
+                ordering.update(set(itertools.chain(*self.regulation.regulation.values())) - set(ordering))
+        else:
+            ordering = self.create_ordering(processes)
 
-        for rule in self.rules:
-            rule_copy = copy.deepcopy(rule)
-            rule_copy.rate_to_vector(ordering, self.definitions)
-            reactions |= rule_copy.create_reactions(self.atomic_signature, self.structure_signature)
+        index = OrderingIndex(ordering)
+        if processes:
+            results = vectorize_in_processes(self, ordering, network, processes)
+        else:
+            results = (vectorize_rule(rule, ordering, index, self.definitions, self.atomic_signature,
+                                      self.structure_signature, network[rule] if reachable else None)
+                       for rule in self.rules)
+
+        vector_reactions = dict()  # (source, target, rate) -> VectorReaction
+        for rate, label, sources, targets in results:
+            key_rate = str(rate)
+            for source, target in zip(sources, targets):
+                key = (source.tobytes(), target.tobytes(), key_rate)
+                if key not in vector_reactions:
+                    vector_reactions[key] = VectorReaction(State(Vector(source), Memory(0)),
+                                                           State(Vector(target), Memory(0)), rate, label)
 
         init = Side(self.init.elements()).to_vector(ordering)
-        vector_reactions = set()
-
-        for reaction in reactions:
-            vector_reactions.add(reaction.to_vector(ordering, self.definitions))
 
         if type(self.regulation) == Conditional:
             regulation = {k: Side(v).to_vector(ordering) for k, v in self.regulation.regulation.items()}
@@ -125,7 +163,65 @@ class Model:
         else:
             regulation = self.regulation
 
-        return VectorModel(vector_reactions, init, ordering, bound, regulation)
+        observables = dict()
+        for name, expression in self.observables.items():
+            observables[name] = copy.deepcopy(expression)
+            observables[name].vectorize(ordering, self.definitions, index)
+
+        return VectorModel(set(vector_reactions.values()), init, ordering, bound, regulation, observables)
+
+    def generate_network(self, max_species: float = np.inf):
+        """
+        Generates reaction network reachable from the initial state (as done by BioNetGen).
+
+        Starting from the initial complexes, rules are iteratively applied to all combinations
+        of known complexes which include at least one complex discovered in the previous iteration,
+        until no new complex is discovered. Rules are applied the same way as in the direct
+        generation of transition system (see Rule.apply), only context of complexes created
+        from nothing is filled according to the signatures (see Rule.specify_created).
+
+        If the number of complexes would exceed max_species, reactions producing new complexes
+        are omitted and the network is truncated.
+
+        :param max_species: maximal number of complexes
+        :return: SortedList of reachable complexes and dict of (Rule, set of (consumed, produced) Multisets)
+        """
+        species = list(dict.fromkeys(self.init))
+        known = set(species)
+        network = {rule: set() for rule in self.rules}
+        patterns = {rule: rule.create_complexes()[0].agents for rule in self.rules}
+        variants = {rule: rule.specify_created(self.atomic_signature, self.structure_signature)
+                    for rule in self.rules}
+
+        processed = 0
+        while True:
+            end = len(species)
+            for rule in self.rules:
+                lhs = patterns[rule]
+                if not lhs:
+                    matches = [[]] if processed == 0 else []
+                else:
+                    compatible = [[i for i in range(end) if pattern.compatible(species[i])] for pattern in lhs]
+                    matches = []
+                    # the first pattern matched to a new complex is the j-th one
+                    for j in range(len(lhs)):
+                        candidates = [[i for i in indices if i < processed] for indices in compatible[:j]] + \
+                                     [[i for i in compatible[j] if i >= processed]] + compatible[j + 1:]
+                        matches += find_all_matches(lhs, species, [len(lhs)] * end, candidates)
+
+                for match, variant in itertools.product(matches, variants[rule]):
+                    consumed, produced = variant.apply(sum(match, []))
+                    new = set(produced.value) - known
+                    if len(species) + len(new) <= max_species:
+                        species += sorted(new)
+                        known |= new
+                        network[rule].add((consumed, produced))
+
+            if end == len(species):
+                break
+            processed = end
+
+        return SortedList(species), network
 
     def eliminate_redundant(self):
         """
@@ -169,27 +265,48 @@ class Model:
         """
         return any(list(map(lambda a: a.exists_compatible_agent(agent), self.rules)))
 
-    def network_free_simulation(self, max_time: float):
+    def network_free_simulation(self, max_time: float, step: float = None, times: list = None,
+                                observables: bool = False):
         """
         Direct simulation method using Network-free Gillespie method.
 
+        By default the state is recorded after every event. If time points are requested (by step
+        or times), only states valid at these time points are recorded, so the memory is bounded
+        by the size of the output. Instead of counts of all complexes, only values of observables
+        can be recorded.
+
         :param max_time: maximal simulation time
+        :param step: distance between requested time points
+        :param times: requested time points (overrides max_time and step)
+        :param observables: record only values of observables of the model
         :return: generated dataframe containing simulated time series
         """
-        memory = 0 if not self.regulation else self.regulation.memory
-        state = State(Multiset(self.init), Memory(memory))
+        if times is not None:
+            points = np.sort(np.array(times, dtype=float))
+        elif step is not None:
+            points = np.arange(0, max_time + step, step)
+        else:
+            points = None
+
+        memory = Memory(0) if not self.regulation else self.regulation.create_memory()
+        state = State(Multiset(self.init), memory)
         
         for rule in self.rules:
             # precompute complexes for each rule
             rule.lhs, rule.rhs = rule.create_complexes()
             rule.rate_agents, _ = rule.rate.get_params_and_agents()
+        observed = {name: expression.get_params_and_agents()[0] for name, expression in self.observables.items()}
+
+        def observe(state):
+            if observables:
+                return [self.evaluate_observable(name, observed[name], state) for name in self.observables]
+            return state.content.value
 
-        time_series = dict()
-        collected_agents = set(state.content.value)
+        time_series = [(0.0, observe(state))] if points is None else []
         time = 0.0
-        time_series[time] = state
         bound = self.compute_bound()
-        while time < max_time:
+        while time < max_time if points is None else len(time_series) < len(points):
+            successor = state
             candidate_rules = pd.DataFrame(data=[(rule,
                                                   rule.evaluate_rate(state, self.definitions),
                                                   rule.match(state)) for rule in self.rules],
@@ -215,31 +332,54 @@ class Model:
                 # apply chosen rule to matched agents
                 match = sorted_candidates.iloc[0]["match"]
                 rule = sorted_candidates.iloc[0]["rule"]
-                produced_agents = rule.replace(match)
+                consumed, produced = rule.apply(match)
 
                 # update state based on match & replace operation
-                match = rule.reconstruct_complexes_from_match(match)
-                state = state.update_state(match, produced_agents, rule.label, bound)
+                successor = state.update_state(consumed, produced, rule.label, bound)
             else:
                 rates_sum = random.uniform(0.5, 0.9)
 
             # update time
             time += random.expovariate(rates_sum)
-            collected_agents = collected_agents.union(set(state.content.value))
-            time_series[time] = state
+            if points is None:
+                time_series.append((time, observe(successor)))
+            else:
+                # the state is valid until the next event
+                end = points.searchsorted(time, side="left")
+                if end > len(time_series):
+                    values = observe(state)
+                    time_series += [(point, values) for point in points[len(time_series):end]]
+            state = successor
 
         # create pandas DataFrame
-        ordered_agents = list(collected_agents)
-        header = list(map(str, ordered_agents))
-        df = pd.DataFrame(columns=header)
-        for time in time_series:
-            vector = [time_series[time].content.value[agent] for agent in ordered_agents]
-            df.loc[time] = vector
-
-        df.index.name = 'times'
-        df.reset_index(inplace=True)
+        if observables:
+            header = list(self.observables)
+            data = [values for _, values in time_series]
+        else:
+            ordered_agents = list(set(itertools.chain.from_iterable(values for _, values in time_series)))
+            header = list(map(str, ordered_agents))
+            data = [[values[agent] for agent in ordered_agents] for _, values in time_series]
+
+        df = pd.DataFrame(data=data, columns=header, dtype=float)
+        df.insert(0, "times", [time for time, _ in time_series])
         return df
 
+    def evaluate_observable(self, name: str, agents: set, state: State) -> float:
+        """
+        Evaluates observable in given state of the direct approach.
+
+        :param name: name of the observable
+        :param agents: Complexes used in the observable
+        :param state: given State
+        :return: value of the observable (nan if undefined)
+        """
+        values = dict()
+        for state_complex, count in state.content.value.items():
+            for agent in agents:
+                if agent.compatible(state_complex):
+                    values[agent] = values.get(agent, 0) + count
+        return to_float(self.observables[name].evaluate_direct(values, self.definitions))
+
     def compute_bound(self):
         """
         Estimates bound from the rules and initial state.
@@ -251,13 +391,15 @@ class Model:
             bound = max(bound, max(rule.lhs.most_frequent(), rule.rhs.most_frequent()))
         return max(bound, Side(self.init).most_frequent())
     
-    def generate_direct_transition_system(self, max_time: float = np.inf, max_size: float = np.inf, bound=None):
+    def generate_direct_transition_system(self, max_time: float = np.inf, max_size: float = np.inf, bound=None,
+                                          processes: int = None):
         """
         Generates transition system using direct rule firing.
 
         :param max_time: max time for TS generating before interrupting
         :param max_size: max allowed size of TS before interrupting
         :param bound: bound for individual elements
+        :param processes: number of worker processes, threads are used if not given
         :return: generated transitions system
         """
 
@@ -265,40 +407,43 @@ class Model:
             # precompute complexes for each rule
             rule.lhs, rule.rhs = rule.create_complexes()
             rule.rate_agents, _ = rule.rate.get_params_and_agents()
+        self.match_cache = MatchCache(self.rules, self.definitions)
 
         if bound is None:
             bound = self.compute_bound()
 
         ts = TransitionSystem(bound=bound)
-        memory = 0 if not self.regulation else self.regulation.memory
-        ts.init = State(Multiset(self.init), Memory(memory))
+        memory = Memory(0) if not self.regulation else self.regulation.create_memory()
+        init = State(Multiset(self.init), memory)
+        ts.states_encoding = StateStore()
+        ts.init, _ = ts.states_encoding.add(init)
         ts.unprocessed = {ts.init}
-        ts.unique_complexes.update(set(ts.init.content.value))
+        ts.unique_complexes.update(set(init.content.value))
 
-        workers = [TSworker(ts, self.rules, self.definitions, self.regulation)
-                   for _ in range(multiprocessing.cpu_count())]
-        for worker in workers:
-            worker.start()
+        if processes:
+            return generate_in_processes(ts, self, processes, max_time, max_size)
 
-        workers[0].work.set()
-        start_time = time.time()
+        return generate_in_threads(ts, self, max_time, max_size)
 
-        try:
-            while any([worker.work.is_set() for worker in workers]) \
-                    and time.time() - start_time < max_time \
-                    and len(ts.states) < max_size:
-                handle_number_of_threads(len(ts.unprocessed), workers)
-                time.sleep(1)
-        except (KeyboardInterrupt, EOFError) as e:
-            pass
+    def outgoing_edges(self, state: State, bound) -> list:
+        """
+        Computes all outgoing Edges of given State by direct rule firing.
 
-        for worker in workers:
-            worker.join()
+        :param state: given State
+        :param bound: bound for individual elements
+        :return: list of Edges normalised to probabilities
+        """
+        return process_state(state, self.match_cache, self.regulation, bound)
 
-        while any([worker.is_alive() for worker in workers]):
-            time.sleep(1)
+    def outgoing_edges_batch(self, states: list, bound) -> list:
+        """
+        Computes outgoing Edges of a block of States (one by one, rules are not vectorised).
 
-        return ts
+        :param states: given States
+        :param bound: bound for individual elements
+        :return: list of lists of Edges (in the order of given states)
+        """
+        return [self.outgoing_edges(state, bound) for state in states]
     
     def export_sbml(self) -> libsbml.SBMLDocument:
         """
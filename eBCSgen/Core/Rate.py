@@ -1,8 +1,11 @@
+import math
+
 import numpy as np
 import sympy
 from lark import Transformer, Tree, Token
 from sortedcontainers import SortedList
 
+from eBCSgen.Core.Complex import OrderingIndex
 from eBCSgen.TS.State import Vector
 from eBCSgen.utils import tree_to_string
 
@@ -12,6 +15,13 @@ STATIC_MATH = """<kineticLaw><math xmlns="http://www.w3.org/1998/Math/MathML"><a
 class Rate:
     def __init__(self, expression):
         self.expression = expression
+        self.template = None  # compiled sympy expression, see compile()
+        self.agents = None  # matrix of vectors of agents used in the rate
+        self.symbols = []  # placeholders of the agents in the template
+        self.params = set()  # free parameters of the template
+        self.function = None  # numeric function of the agents (only without params)
+        self.batch_function = None  # the same function working on NumPy arrays
+        self.hash_value = None  # cached hash, reset whenever the expression changes
 
     def __eq__(self, other):
         return self.expression == other.expression
@@ -23,9 +33,20 @@ class Rate:
         return self.expression if type(self.expression) == str else "".join(self.get_formula_in_list())
 
     def __hash__(self):
-        return hash(str(self))
-
-    def vectorize(self, ordering: SortedList, definitions: dict) -> list:
+        if self.hash_value is None:
+            self.hash_value = hash(str(self))
+        return self.hash_value
+
+    def __getstate__(self):
+        # lambdified functions cannot be pickled, they are created again when needed
+        state = self.__dict__.copy()
+        state['function'] = None
+        state['batch_function'] = None
+        # hash of strings differs between processes
+        state['hash_value'] = None
+        return state
+
+    def vectorize(self, ordering: SortedList, definitions: dict, index: OrderingIndex = None) -> list:
         """
         Converts all occurrences of Complexes (resp. sub trees named agent)
         with its vector representation. These are directly replaced within
@@ -36,28 +57,126 @@ class Rate:
 
         :param ordering: given SortedList of Complexes
         :param definitions: dict of (param_name, value)
+        :param index: OrderingIndex of the ordering (can be shared by more rates)
         :return: list of transformed States (just for testing)
         """
-        vec = Vectorizer(ordering, definitions)
+        vec = Vectorizer(ordering, definitions, index)
         self.expression = vec.transform(self.expression)
+        self.hash_value = None
+        self.compile()
         return vec.visited
 
+    def compile(self):
+        """
+        Compiles vectorized expression, so it does not have to be parsed in every evaluation.
+
+        Each agent is replaced by a placeholder symbol and its vector is stored as a row
+        of self.agents, so values of all agents in a state are obtained by a single product.
+        The expression is kept unevaluated (e.g. x/x is not simplified to 1) to preserve
+        the results of evaluation in particular states.
+
+        If the rate has no free parameters, it is further lambdified to a numeric function.
+        """
+        compiler = Compiler()
+        result = compiler.transform(self.expression)
+        self.template = sympy.sympify("".join(tree_to_string(result)), locals=compiler.locals, evaluate=False)
+        self.agents = np.array(compiler.vectors)
+        self.symbols = compiler.symbols
+        self.params = self.template.free_symbols - set(self.symbols)
+        self.function = None
+        self.batch_function = None
+
+    def get_function(self):
+        """
+        :return: lambdified numeric function of values of agents
+        """
+        if self.function is None:
+            self.function = sympy.lambdify(self.symbols, self.template, modules="math")
+        return self.function
+
+    def get_batch_function(self):
+        """
+        :return: lambdified numeric function of columns of values of agents
+        """
+        if self.batch_function is None:
+            self.batch_function = sympy.lambdify(self.symbols, self.template, modules="numpy")
+        return self.batch_function
+
     def evaluate(self, state) -> float:
         """
-        Evaluates all occurrences of States to a float using Evaluater.
-        It is done as intersection of particular state with given state
+        Evaluates the compiled rate in given state.
+        Values of agents are computed as intersection of particular agent with given state
         and sum of resulting elements.
 
+        Rates without parameters are evaluated by the numeric function, in the case of
+        exceptional result (e.g. division by zero, overflow) the symbolic template is used instead.
+        Parametric rates are obtained by substitution to the template.
+
         If the result is nan, None is returned instead.
 
         :param state: given state
-        :return: Sympy object for expression representation
+        :return: float or Sympy object for expression representation
         """
-        evaluater = Evaluater(state)
-        result = evaluater.transform(self.expression)
+        if self.template is None:
+            self.compile()
+
+        values = (self.agents @ state.content.value).tolist() if self.symbols else []
+
+        if not self.params:
+            try:
+                value = self.get_function()(*values)
+                if isinstance(value, (int, float)) and math.isfinite(value):
+                    return value
+            except (ArithmeticError, ValueError):
+                pass
+
+        return self.substitute(values)
+
+    def evaluate_batch(self, values: np.array) -> np.array:
+        """
+        Evaluates the compiled rate in a block of states at once.
+
+        Rates without parameters are computed by a single call of NumPy function,
+        exceptional results (nan, infinity) are obtained from the template as in evaluate,
+        so both give the same result in every state. Parametric rates are obtained
+        by substitution to the template for each state separately.
 
+        :param values: 2-D array of states, one state per row
+        :return: float array of rates or object array of Sympy objects (None for nan)
+            for parametric rates and exceptional results
+        """
+        if self.template is None:
+            self.compile()
+
+        agents = (values @ self.agents.T).astype(float) if self.symbols else np.zeros((len(values), 0))
+
+        if not self.params:
+            with np.errstate(all="ignore"):
+                result = self.get_batch_function()(*agents.T)
+            result = np.array(np.broadcast_to(result, len(values)), dtype=float)
+            exceptional = np.flatnonzero(~np.isfinite(result))
+            if not len(exceptional):
+                return result
+
+            result = result.astype(object)
+            for i in exceptional:
+                result[i] = self.substitute(agents[i].tolist())
+            return result
+
+        result = np.empty(len(values), dtype=object)
+        for i, row in enumerate(agents):
+            result[i] = self.substitute(row.tolist())
+        return result
+
+    def substitute(self, values: list):
+        """
+        Substitutes values of agents to the template.
+
+        :param values: values of agents in the order of self.symbols
+        :return: Sympy object for expression representation or None if the result is nan
+        """
         try:
-            value = sympy.sympify("".join(tree_to_string(result)), locals=evaluater.locals)
+            value = self.template.xreplace(dict(zip(self.symbols, values)))
             if value == sympy.nan:
                 return None
             return value
@@ -72,6 +191,7 @@ class Rate:
         """
         transformer = SymbolicAgents()
         self.expression = transformer.transform(self.expression)
+        self.hash_value = None
 
     def reduce_context(self) -> 'Rate':
         """
@@ -147,18 +267,17 @@ class SymbolicAgents(Transformer):
 
 
 class Vectorizer(Transformer):
-    def __init__(self, ordering, definitions):
+    def __init__(self, ordering, definitions, index=None):
         super(Vectorizer, self).__init__()
         self.ordering = ordering
         self.definitions = definitions
+        self.index = index if index else OrderingIndex(ordering)
         self.visited = []
 
     def agent(self, complex):
         complex = complex[0]
         result = np.zeros(len(self.ordering))
-        for i in range(len(self.ordering)):
-            if complex.compatible(self.ordering[i]):
-                result[i] = 1
+        result[self.index.compatible(complex)] = 1
 
         result = Vector(result)
         self.visited.append(result)
@@ -171,17 +290,22 @@ class Vectorizer(Transformer):
         return self.definitions.get(str(matches[0]), Tree("param", matches))
 
 
-class Evaluater(Transformer):
-    def __init__(self, state):
-        super(Evaluater, self).__init__()
-        self.state = state
+class Compiler(Transformer):
+    def __init__(self):
+        super(Compiler, self).__init__()
+        self.vectors = []
+        self.symbols = []
         self.locals = dict()
 
-    def agent(self, state):
-        return sum(self.state.content * state[0])
+    def agent(self, vector):
+        name = "__agent{}".format(len(self.vectors))
+        self.vectors.append(vector[0].value)
+        self.symbols.append(sympy.Symbol(name))
+        self.locals[name] = self.symbols[-1]
+        return name
 
     def param(self, matches):
-        name = matches[0]
+        name = str(matches[0])
         self.locals[name] = sympy.Symbol(name)
         return name
 
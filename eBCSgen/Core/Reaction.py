@@ -18,6 +18,7 @@ class Reaction:
         self.rhs = rhs
         self.rate = rate
         self.label = label
+        self.hash_value = None
 
     def __eq__(self, other: 'Reaction'):
         return self.lhs == other.lhs and self.rhs == other.rhs and self.rate == other.rate
@@ -33,7 +34,14 @@ class Reaction:
         return str(self) < str(other)
 
     def __hash__(self):
-        return hash((self.lhs, self.rhs, self.rate))
+        if self.hash_value is None:
+            self.hash_value = hash((self.lhs, self.rhs))
+        return self.hash_value
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['hash_value'] = None
+        return state
 
     def to_vector(self, ordering: SortedList, definitions: dict) -> VectorReaction:
         """
@@ -5,10 +5,13 @@ from copy import copy, deepcopy
 
 from eBCSgen.Core.Rate import Rate
 from eBCSgen.Core.Complex import Complex
+from eBCSgen.Core.Interning import BoundedCache
 from eBCSgen.Core.Side import Side
 from eBCSgen.Core.Reaction import Reaction
 from eBCSgen.TS.State import Multiset
 
+APPLICATIONS_SIZE = 2 ** 12  # number of cached applications of a rule
+
 
 def column(lst, index):
     return tuple(map(lambda x: x[index], lst))
@@ -43,6 +46,8 @@ class Rule:
         self.rate = rate
         self.label = label
         self.comment = (False, [])
+        self.hash_value = None
+        self.applications = None  # cache of apply()
 
     def __eq__(self, other: "Rule"):
         return (
@@ -84,7 +89,17 @@ class Rule:
         return str(self) < str(other)
 
     def __hash__(self):
-        return hash(str(self))
+        # based only on the structure of the rule, rate and comment are changed when the model is processed
+        if self.hash_value is None:
+            self.hash_value = hash((self.agents, self.mid, tuple(self.compartments),
+                                    tuple(self.complexes), tuple(self.pairs)))
+        return self.hash_value
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['hash_value'] = None
+        state['applications'] = None
+        return state
 
     def get_unique_complexes_from_rule(self) -> dict:
         """
@@ -124,27 +139,40 @@ class Rule:
         lhs, rhs = self.create_complexes()
         return Reaction(lhs, rhs, copy(self.rate), self.label)
 
-    def rate_to_vector(self, ordering, definitions: dict):
+    def rate_to_vector(self, ordering, definitions: dict, index=None):
         """
         Converts all occurrences of Complexes in rate to vector representation.
 
         :param ordering: given ordering of unique of Complexes (as sortedcontainers.SortedList)
         :param definitions: dict of (param_name, value)
+        :param index: OrderingIndex of the ordering (optional)
         """
         if self.rate:
-            self.rate.vectorize(ordering, definitions)
+            self.rate.vectorize(ordering, definitions, index)
 
     def create_reactions(
         self, atomic_signature: dict, structure_signature: dict
     ) -> set:
         """
         Create all possible reactions.
-        Decide if rule is of replication type and call corresponding lower level method.
 
         :param atomic_signature: given mapping of atomic name to possible states
         :param structure_signature: given mapping of structure name to possible atomics
         :return: set of created reactions
         """
+        return set(self.generate_reactions(atomic_signature, structure_signature))
+
+    def generate_reactions(self, atomic_signature: dict, structure_signature: dict):
+        """
+        Lazily creates all possible reactions, one at a time.
+        Decide if rule is of replication type and call corresponding lower level method.
+
+        The reactions share the rate of the rule (it is not copied).
+
+        :param atomic_signature: given mapping of atomic name to possible states
+        :param structure_signature: given mapping of structure name to possible atomics
+        :return: generator of created reactions (possibly with duplicates)
+        """
         unique_lhs_indices = set(column(self.pairs, 0))
         if (
             len(self.pairs) > 1
@@ -160,13 +188,13 @@ class Rule:
 
     def _create_replication_reactions(
         self, atomic_signature: dict, structure_signature: dict
-    ) -> set:
+    ):
         """
         Create reaction from rule of special form for replication (A -> 2 A)
 
         :param atomic_signature:  given mapping of atomic name to possible states
         :param structure_signature: given mapping of structure name to possible atomics
-        :return: set of created reactions
+        :return: generator of created reactions
         """
         # create only for first pair
         l, r = self.pairs[0]
@@ -174,35 +202,23 @@ class Rule:
         right = self.agents[r]
         results = left.add_context(right, atomic_signature, structure_signature)
 
-        reactions = set()
         for result in results:
             new_agents = list(result)
             # replicate RHS agent n times
             for _ in range(len(self.pairs)):
                 new_agents.append(deepcopy(new_agents[-1]))
-            new_rule = Rule(
-                tuple(new_agents),
-                self.mid,
-                self.compartments,
-                self.complexes,
-                self.pairs,
-                self.rate,
-                self.label,
-            )
-            reactions.add(new_rule.to_reaction())
-
-        return reactions
+            yield self.instantiate(tuple(new_agents))
 
     def _create_normal_reactions(
         self, atomic_signature: dict, structure_signature: dict
-    ) -> set:
+    ):
         """
         Adds context to all agents and generated all possible combinations.
         Then, new rules with these enhances agents are generated and converted to Reactions.
 
         :param atomic_signature: given mapping of atomic name to possible states
         :param structure_signature: given mapping of structure name to possible atomics
-        :return: set of created reactions
+        :return: generator of created reactions
         """
         results = []
         for l, r in self.pairs:
@@ -219,21 +235,52 @@ class Rule:
                 left.add_context(right, atomic_signature, structure_signature)
             )
 
-        reactions = set()
         for result in itertools.product(*results):
             new_agents = tuple(filter(None, column(result, 0) + column(result, 1)))
-            new_rule = Rule(
-                new_agents,
-                self.mid,
-                self.compartments,
-                self.complexes,
-                self.pairs,
-                self.rate,
-                self.label,
-            )
-            reactions.add(new_rule.to_reaction())
+            yield self.instantiate(new_agents)
+
+    def instantiate(self, agents: tuple) -> Reaction:
+        """
+        Creates Reaction from the rule with given (more specified) agents.
+
+        :param agents: agents replacing agents of the rule
+        :return: created Reaction sharing the rate of the rule
+        """
+        new_rule = Rule(
+            agents,
+            self.mid,
+            self.compartments,
+            self.complexes,
+            self.pairs,
+            self.rate,
+            self.label,
+        )
+        lhs, rhs = new_rule.create_complexes()
+        return Reaction(lhs, rhs, self.rate, self.label)
 
-        return reactions
+    def specify_created(self, atomic_signature: dict, structure_signature: dict) -> list:
+        """
+        Creates variants of the rule where agents created from nothing (without a pair on LHS)
+        have all context filled, the same way as in create_reactions.
+
+        :param atomic_signature: given mapping of atomic name to possible states
+        :param structure_signature: given mapping of structure name to possible atomics
+        :return: list of Rules
+        """
+        created = [r for l, r in self.pairs if l is None]
+        if not created:
+            return [self]
+
+        options = [[pair[1] for pair in self.agents[r].add_context(-1, atomic_signature, structure_signature)]
+                   for r in created]
+        variants = []
+        for result in itertools.product(*options):
+            new_agents = list(self.agents)
+            for r, agent in zip(created, result):
+                new_agents[r] = agent
+            variants.append(Rule(tuple(new_agents), self.mid, self.compartments, self.complexes,
+                                 self.pairs, self.rate, self.label))
+        return variants
 
     def compatible(self, other: "Rule") -> bool:
         """
@@ -316,20 +363,49 @@ class Rule:
         """
         Find all possible matches of the rule to given state.
 
+        Complexes of the state are referred to by their index and their counts are changed
+        in place during the search, so the state is never copied. A single match is chosen
+        randomly in proportion to its multiplicity (see sample_match), not uniformly among
+        the matches returned for all=True.
+
         :param state: given state
         :param all: bool to indicate if choose one matching randomly or return all of them
         :return: random match/all matches
         """
-        state = deepcopy(state.content.value)
-        matches = find_all_matches(self.lhs.agents, state)
+        species = list(state.content.value)
+        counts = [state.content.value[complex] for complex in species]
+        candidates = [[i for i, complex in enumerate(species) if pattern.compatible(complex)]
+                      for pattern in self.lhs.agents]
+
+        if not all:
+            return sample_match(self.lhs.agents, species, counts, candidates)
+
+        matches = find_all_matches(self.lhs.agents, species, counts, candidates)
         matches = [sum(match, []) for match in matches]
 
         if len(matches) == 0:
             return None
-        if not all:
-            return random.choice(matches)
         return matches
 
+    def apply(self, aligned_match):
+        """
+        Computes complexes consumed and produced when the rule is applied to given match.
+
+        The same match recurs in many states, so results are cached for IDs of the matched agents.
+        Returned Multisets are shared and must not be modified.
+
+        :param aligned_match: agents fitting LHS of the rule
+        :return: consumed and produced Multisets
+        """
+        if self.applications is None:
+            self.applications = BoundedCache(APPLICATIONS_SIZE)
+        key = tuple(agent.intern() for agent in aligned_match)
+        result = self.applications.get(key)
+        if result is None:
+            result = self.reconstruct_complexes_from_match(aligned_match), self.replace(aligned_match)
+            self.applications.add(key, result)
+        return result
+
     def replace(self, aligned_match):
         """
         Apply rule to chosen match.
@@ -439,24 +515,72 @@ class Rule:
         return Rule(agents, mid, compartments, complexes, pairs, rate, label)
 
 
-def find_all_matches(lhs_agents, state):
+def find_all_matches(lhs_agents, species, counts, candidates, level=0):
     """
     Finds all possible matches which actually can be used for given state.
 
+    A complex chosen for a pattern stays unavailable for the following candidates
+    of the same pattern, so symmetric matches are not repeated.
+
     :param lhs_agents: given LHS of a rule
-    :param state: state to be applied to
+    :param species: complexes of the state
+    :param counts: their counts, changed in place and restored before returning
+    :param candidates: for each pattern, indices of compatible complexes
+    :param level: index of the current pattern
     :return: candidates for match
     """
     choices = []
-    if len(lhs_agents) == 0:
+    if level == len(lhs_agents):
         return [choices]
 
-    lhs_complex = lhs_agents[0]
-    for candidate in list(state):
-        if lhs_complex.compatible(candidate):
-            state[candidate] -= 1
-            aligns = candidate.align_match(lhs_complex)
-            for branch in find_all_matches(lhs_agents[1:], deepcopy(+state)):
+    used = []
+    for i in candidates[level]:
+        if counts[i] > 0:
+            counts[i] -= 1
+            used.append(i)
+            aligns = species[i].align_match(lhs_agents[level])
+            for branch in find_all_matches(lhs_agents, species, counts, candidates, level + 1):
                 for align in aligns:
                     choices.append([align] + branch)
+    for i in used:
+        counts[i] += 1
     return choices
+
+
+def sample_match(lhs_agents, species, counts, candidates):
+    """
+    Chooses a random match in proportion to its multiplicity (mass action).
+
+    Each ordered way of picking particular complexes of the state for the patterns (and alignment
+    of their agents) is equally likely, e.g. for patterns A + A and a state with n copies of a
+    complex and m copies of another one, picking the first complex twice has weight n * (n - 1)
+    and picking one of each has weight 2 * n * m (both orderings). Unlike in find_all_matches,
+    symmetric matches are not merged, so the result can be any ordering of the picked complexes.
+
+    :param lhs_agents: given LHS of a rule
+    :param species: complexes of the state
+    :param counts: their counts, changed in place and restored before returning
+    :param candidates: for each pattern, indices of compatible complexes
+    :return: random match or None if there is none
+    """
+    embeddings, weights = [], []
+
+    def embed(level, chosen, weight):
+        if level == len(lhs_agents):
+            embeddings.append(list(chosen))
+            weights.append(weight)
+            return
+        for i in candidates[level]:
+            if counts[i] > 0:
+                multiplicity = counts[i] * len(species[i].align_match(lhs_agents[level]))
+                counts[i] -= 1
+                chosen.append(i)
+                embed(level + 1, chosen, weight * multiplicity)
+                chosen.pop()
+                counts[i] += 1
+
+    embed(0, [], 1)
+    if not embeddings:
+        return None
+    chosen = random.choices(embeddings, weights)[0]
+    return sum([random.choice(species[i].align_match(pattern)) for i, pattern in zip(chosen, lhs_agents)], [])
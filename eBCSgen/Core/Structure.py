@@ -2,12 +2,14 @@ import itertools
 from copy import deepcopy
 
 from eBCSgen.Core.Atomic import AtomicAgent
+from eBCSgen.Core.Interning import AGENTS
 
 
 class StructureAgent:
     def __init__(self, name: str, composition: set):
         self.name = name
         self.composition = composition
+        self.id = None  # see intern()
 
     def __repr__(self):
         return str(self)
@@ -16,15 +18,34 @@ class StructureAgent:
         return self.name + "(" + ",".join(list(map(str, sorted(self.composition)))) + ")"
 
     def __lt__(self, other: 'StructureAgent'):
-        return str(self) < str(other)
+        return AGENTS.sort_keys[self.intern()] < AGENTS.sort_keys[other.intern()]
 
     def __eq__(self, other: 'StructureAgent'):
         if type(self) != type(other):
             return False
-        return self.name == other.name and self.composition == other.composition
+        return self.intern() == other.intern()
 
     def __hash__(self):
-        return hash(str(self))
+        return self.intern()
+
+    def __getstate__(self):
+        # IDs are valid only in the current process
+        state = self.__dict__.copy()
+        state['id'] = None
+        return state
+
+    def intern(self) -> int:
+        """
+        Obtains integer ID of the agent, equal agents have the same ID.
+
+        The composition must not be changed once the ID is assigned.
+
+        :return: ID from the table of agents
+        """
+        if self.id is None:
+            form = ('structure', self.name, frozenset(atomic.intern() for atomic in self.composition))
+            self.id = AGENTS.intern(form, self.__str__)
+        return self.id
 
     def compatible(self, other: 'StructureAgent'):
         """
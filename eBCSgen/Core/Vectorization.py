@@ -0,0 +1,115 @@
+import copy
+import multiprocessing
+
+import numpy as np
+from lark.exceptions import VisitError
+
+from eBCSgen.Core.Complex import OrderingIndex
+from eBCSgen.Core.Reaction import Reaction
+from eBCSgen.Core.Side import Side
+
+# state of the worker process, set once by init_worker
+_worker = dict()
+
+
+def init_worker(atomic_signature: dict, structure_signature: dict, definitions: dict = None, ordering=None):
+    """
+    Stores data shared by all rules in the worker process, so they are not sent with every rule.
+    The OrderingIndex is built once per worker.
+    """
+    _worker['atomic_signature'] = atomic_signature
+    _worker['structure_signature'] = structure_signature
+    _worker['definitions'] = definitions
+    _worker['ordering'] = ordering
+    _worker['index'] = OrderingIndex(ordering) if ordering is not None else None
+
+
+def compatible_complexes(rule) -> set:
+    """
+    :param rule: given Rule
+    :return: set of all complexes compatible with the rule (in the worker process)
+    """
+    return rule.create_all_compatible(_worker['atomic_signature'], _worker['structure_signature'])
+
+
+def vectorize_task(task: tuple) -> tuple:
+    """
+    Vectorizes a rule in the worker process.
+
+    :param task: pair (Rule, its reachable network or None)
+    :return: see vectorize_rule
+    """
+    rule, network = task
+    try:
+        return vectorize_rule(rule, _worker['ordering'], _worker['index'], _worker['definitions'],
+                              _worker['atomic_signature'], _worker['structure_signature'], network)
+    except VisitError as e:
+        # VisitError cannot be sent back to the main process, its cause is raised instead
+        raise e.orig_exc
+
+
+def vectorize_rule(rule, ordering, index: OrderingIndex, definitions: dict,
+                   atomic_signature: dict, structure_signature: dict, network: set = None) -> tuple:
+    """
+    Creates reactions of given rule in vector representation.
+
+    Reactions are generated one at a time and deduplicated by their vectors, the result
+    is compact (two matrices) so it can be cheaply sent between processes.
+
+    :param rule: given Rule
+    :param ordering: given ordering of unique Complexes
+    :param index: OrderingIndex of the ordering
+    :param definitions: dict of (param_name, value)
+    :param atomic_signature: given atomic signature
+    :param structure_signature: given structure signature
+    :param network: set of (consumed, produced) Multisets of the rule, all reactions are created if None
+    :return: vectorized Rate, label, matrix of sources and matrix of targets (one reaction per row)
+    """
+    rule = copy.deepcopy(rule)
+    rule.rate_to_vector(ordering, definitions, index)
+    if network is not None:
+        reactions = (Reaction(Side(list(consumed.value.elements())), Side(list(produced.value.elements())),
+                              rule.rate, rule.label) for consumed, produced in network)
+    else:
+        reactions = rule.generate_reactions(atomic_signature, structure_signature)
+
+    pairs = dict()  # (source, target) -> vectors
+    for reaction in reactions:
+        source = reaction.lhs.to_vector(ordering).content.value
+        target = reaction.rhs.to_vector(ordering).content.value
+        pairs.setdefault((source.tobytes(), target.tobytes()), (source, target))
+
+    sources = np.array([source for source, _ in pairs.values()]).reshape(len(pairs), len(ordering))
+    targets = np.array([target for _, target in pairs.values()]).reshape(len(pairs), len(ordering))
+    return rule.rate, rule.label, sources, targets
+
+
+def create_ordering_in_processes(model, processes: int) -> set:
+    """
+    Collects complexes compatible with rules of the model using a pool of worker processes.
+
+    :param model: given Model
+    :param processes: number of worker processes
+    :return: set of unique complexes
+    """
+    with multiprocessing.Pool(processes, init_worker, (model.atomic_signature, model.structure_signature)) as pool:
+        unique_complexes = set()
+        for complexes in pool.imap(compatible_complexes, model.rules):
+            unique_complexes |= complexes
+    return unique_complexes
+
+
+def vectorize_in_processes(model, ordering, network: dict, processes: int) -> list:
+    """
+    Vectorizes rules of the model using a pool of worker processes, one rule per task.
+
+    :param model: given Model
+    :param ordering: given ordering of unique Complexes
+    :param network: dict of rule -> set of (consumed, produced) or None
+    :param processes: number of worker processes
+    :return: list of results of vectorize_rule in order of model.rules
+    """
+    tasks = [(rule, network[rule] if network is not None else None) for rule in model.rules]
+    with multiprocessing.Pool(processes, init_worker, (model.atomic_signature, model.structure_signature,
+                                                       model.definitions, ordering)) as pool:
+        return pool.map(vectorize_task, tasks, chunksize=1)
@@ -22,6 +22,8 @@ from eBCSgen.Regulations.Regular import Regular
 from eBCSgen.TS.State import State, Memory, Vector
 from eBCSgen.TS.TransitionSystem import TransitionSystem
 from eBCSgen.TS.Edge import edge_from_dict
+from eBCSgen.TS.BinaryFormat import read_binary, MappedStates
+from eBCSgen.TS.EdgeArrays import EdgeArrays
 from eBCSgen.Core.Side import Side
 from eBCSgen.Core.Model import Model
 from eBCSgen.Errors.ComplexParsingError import ComplexParsingError
@@ -49,23 +51,45 @@ def load_TS_from_json(json_file: str) -> TransitionSystem:
         )
         ts = TransitionSystem(ordering, data["bound"])
         ts.states_encoding = dict()
+        unprocessed = set(data.get("unprocessed", list()))
         for node_id in data["nodes"]:
             vector = np.array(eval(data["nodes"][node_id]))
             is_hell = True if vector[0] == inf else False
             ts.states_encoding[int(node_id)] = State(Vector(vector), Memory(0), is_hell)
+            if data["nodes"][node_id] in unprocessed:
+                ts.unprocessed.add(int(node_id))
         ts.edges = {edge_from_dict(edge) for edge in data["edges"]}
         ts.init = data["initial"]
         if "parameters" in data:
             ts.params = data["parameters"]
-
-        ts.unprocessed = {
-            State(Vector(np.array(eval(state))), Memory(0))
-            for state in data.get("unprocessed", list())
-        }
-        ts.states = set(ts.states_encoding.values()) - ts.unprocessed
         return ts
 
 
+def load_TS_from_binary(binary_file: str) -> TransitionSystem:
+    """
+    Loads given binary file (see TransitionSystem.save_to_binary) as a TransitionSystem.
+
+    States and edges are memory-mapped and decoded only when accessed.
+
+    :param binary_file: given TS in binary format
+    :return: resulting TransitionSystem
+    """
+    complex_parser = Parser("rate_complex")
+    header, arrays = read_binary(binary_file)
+
+    ordering = SortedList(map(lambda agent: complex_parser.parse(agent).data.children[0], header["ordering"]))
+    ts = TransitionSystem(ordering, header["bound"])
+    memory = header.get("memory", 0)
+    histories = (header["history_items"], arrays["histories"], arrays["history_indptr"]) if memory else None
+    ts.states_encoding = MappedStates(arrays["states"], header["first"], header["hell"], memory, histories)
+    ts.edges = EdgeArrays(arrays["indptr"], arrays["targets"], arrays["probabilities"], arrays["edge_labels"],
+                          header["labels"], {int(i): p for i, p in header["expressions"].items()}, header["first"])
+    ts.unprocessed = set(arrays["unprocessed"].tolist())
+    ts.init = header["initial"]
+    ts.params = header["parameters"]
+    return ts
+
+
 class Result:
     """
     Class to represent output from the Parser.
@@ -719,8 +743,15 @@ class TreeToObjects(Transformer):
                 result[init[0].children[0]] = 1
         return {"inits": result}
 
+    def observable_pattern(self, matches):
+        if len(matches) == 1 and isinstance(matches[0], Tree) and matches[0].data == "complex":
+            # observed complexes are treated as agents of rates
+            agents = [agent.children[0] for agent in matches[0].children[0].children]
+            return Tree("observable_pattern", [Tree("agent", [Complex(agents, matches[0].children[2])])])
+        return Tree("observable_pattern", matches)
+
     def observable(self, matches):
-        return {str(matches[0]): matches[1].children}
+        return {str(matches[0]): Rate(matches[1])}
 
     def observables(self, matches):
         result = dict()
@@ -764,7 +795,7 @@ class TreeToObjects(Transformer):
                     regulation = value
 
         params = self.params - set(definitions)
-        return Model(rules, inits, definitions, params, regulation)
+        return Model(rules, inits, definitions, params, regulation, observables)
 
 
 class Parser:
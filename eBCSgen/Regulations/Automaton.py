@@ -0,0 +1,261 @@
+ESCAPES = {'w': lambda c: c.isalnum() or c == '_',
+           'W': lambda c: not (c.isalnum() or c == '_'),
+           'd': lambda c: c.isdecimal(),
+           'D': lambda c: not c.isdecimal(),
+           's': lambda c: c.isspace(),
+           'S': lambda c: not c.isspace()}
+
+SPECIAL = set("()[]{}|*+?.\\^$")
+
+
+class Automaton:
+    """
+    Deterministic automaton accepting prefixes of words of a regular expression over characters.
+
+    The expression is translated to an NFA (Thompson's construction) and determinised lazily:
+    a state of the automaton is a set of NFA states represented as a bit mask, so states are
+    identified deterministically (independently of the order in which they were discovered).
+    Only states from which an accepting state is reachable are kept, the others are None.
+
+    Supported are literals, ., character classes, escapes (\\w, \\d, \\s, escaped special characters),
+    groups, alternation and quantifiers (*, +, ?, {n}, {n,m}, also their lazy variants).
+    Anchors, assertions and possessive quantifiers raise ValueError.
+    """
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.epsilon = []  # NFA state -> list of NFA states
+        self.edges = []  # NFA state -> list of (character predicate, NFA state)
+
+        parser = PatternParser(pattern)
+        start, self.accept = self.build(parser.parse())
+        self.live = self.compute_live()
+        self.initial = self.closure({start})
+        self.transitions = dict()  # (state, label) -> state
+
+    def __getstate__(self):
+        # predicates cannot be pickled, the automaton is built again (its states are the same)
+        return {'pattern': self.pattern}
+
+    def __setstate__(self, state):
+        self.__init__(state['pattern'])
+
+    def new_state(self) -> int:
+        self.epsilon.append([])
+        self.edges.append([])
+        return len(self.epsilon) - 1
+
+    def build(self, node) -> tuple:
+        """
+        Creates NFA fragment for given node of parsed expression.
+
+        :param node: node of expression
+        :return: start and end NFA states of the fragment
+        """
+        kind = node[0]
+        start, end = self.new_state(), self.new_state()
+        if kind == 'char':
+            self.edges[start].append((node[1], end))
+        elif kind == 'concat':
+            current = start
+            for child in node[1]:
+                child_start, child_end = self.build(child)
+                self.epsilon[current].append(child_start)
+                current = child_end
+            self.epsilon[current].append(end)
+        elif kind == 'alternation':
+            for child in node[1]:
+                child_start, child_end = self.build(child)
+                self.epsilon[start].append(child_start)
+                self.epsilon[child_end].append(end)
+        elif kind == 'repeat':
+            child, minimum, maximum = node[1:]
+            current = start
+            for _ in range(minimum):
+                child_start, child_end = self.build(child)
+                self.epsilon[current].append(child_start)
+                current = child_end
+            if maximum is None:
+                child_start, child_end = self.build(child)
+                self.epsilon[current] += [child_start, end]
+                self.epsilon[child_end] += [child_start, end]
+            else:
+                for _ in range(maximum - minimum):
+                    child_start, child_end = self.build(child)
+                    self.epsilon[current] += [child_start, end]
+                    current = child_end
+            self.epsilon[current].append(end)
+        return start, end
+
+    def compute_live(self) -> int:
+        """
+        :return: mask of NFA states from which the accepting state is reachable
+        """
+        predecessors = [[] for _ in self.epsilon]
+        for state in range(len(self.epsilon)):
+            for target in self.epsilon[state] + [target for _, target in self.edges[state]]:
+                predecessors[target].append(state)
+
+        live = {self.accept}
+        stack = [self.accept]
+        while stack:
+            for state in predecessors[stack.pop()]:
+                if state not in live:
+                    live.add(state)
+                    stack.append(state)
+        return sum(1 << state for state in live)
+
+    def closure(self, states: set):
+        """
+        :param states: set of NFA states
+        :return: mask of epsilon closure of given states or None if it is not live
+        """
+        stack = list(states)
+        states = set(states)
+        while stack:
+            for target in self.epsilon[stack.pop()]:
+                if target not in states:
+                    states.add(target)
+                    stack.append(target)
+        mask = sum(1 << state for state in states)
+        return mask if mask & self.live else None
+
+    def step(self, state: int, label: str):
+        """
+        Reads given label (character by character) from given state.
+
+        :param state: mask of the current state
+        :param label: given label
+        :return: mask of the resulting state or None if no word can be matched anymore
+        """
+        key = (state, label)
+        if key not in self.transitions:
+            result = state
+            for character in label:
+                if result is None:
+                    break
+                targets = {target for nfa_state in self.members(result)
+                           for predicate, target in self.edges[nfa_state] if predicate(character)}
+                result = self.closure(targets)
+            self.transitions[key] = result
+        return self.transitions[key]
+
+    def members(self, mask: int) -> list:
+        return [state for state in range(len(self.epsilon)) if mask >> state & 1]
+
+
+class PatternParser:
+    """
+    Recursive descent parser of (a subset of) regular expressions.
+
+    Nodes are tuples ('char', predicate), ('concat', [nodes]), ('alternation', [nodes])
+    and ('repeat', node, minimum, maximum or None).
+    """
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.position = 0
+
+    def peek(self):
+        return self.pattern[self.position] if self.position < len(self.pattern) else None
+
+    def next(self):
+        character = self.peek()
+        if character is None:
+            raise ValueError("Unexpected end of regular expression.")
+        self.position += 1
+        return character
+
+    def parse(self):
+        node = self.alternation()
+        if self.peek() is not None:
+            raise ValueError("Unexpected character {} in regular expression.".format(self.peek()))
+        return node
+
+    def alternation(self):
+        terms = [self.concatenation()]
+        while self.peek() == '|':
+            self.next()
+            terms.append(self.concatenation())
+        return terms[0] if len(terms) == 1 else ('alternation', terms)
+
+    def concatenation(self):
+        factors = []
+        while self.peek() is not None and self.peek() not in '|)':
+            factors.append(self.factor())
+        return ('concat', factors)
+
+    def factor(self):
+        node = self.primary()
+        while self.peek() is not None and self.peek() in '*+?{':
+            quantifier = self.next()
+            if quantifier == '*':
+                node = ('repeat', node, 0, None)
+            elif quantifier == '+':
+                node = ('repeat', node, 1, None)
+            elif quantifier == '?':
+                node = ('repeat', node, 0, 1)
+            else:
+                node = ('repeat', node) + self.counts()
+            if self.peek() == '?':
+                # lazy quantifier accepts the same words
+                self.next()
+            elif self.peek() == '+':
+                raise ValueError("Possessive quantifiers are not supported.")
+        return node
+
+    def counts(self) -> tuple:
+        end = self.pattern.find('}', self.position)
+        if end == -1:
+            raise ValueError("Unterminated repetition.")
+        content = self.pattern[self.position:end].split(',')
+        self.position = end + 1
+        if len(content) == 1:
+            return int(content[0]), int(content[0])
+        return int(content[0] or 0), int(content[1]) if content[1] else None
+
+    def primary(self):
+        character = self.next()
+        if character == '(':
+            if self.peek() == '?':
+                raise ValueError("Extension groups are not supported.")
+            node = self.alternation()
+            if self.next() != ')':
+                raise ValueError("Missing ) in regular expression.")
+            return node
+        if character == '[':
+            return 'char', self.character_class()
+        if character == '.':
+            return 'char', lambda c: c != '\n'
+        if character == '\\':
+            return 'char', self.escape()
+        if character in '^$)':
+            raise ValueError("Anchors are not supported.")
+        return 'char', literal(character)
+
+    def escape(self):
+        character = self.next()
+        if character in ESCAPES:
+            return ESCAPES[character]
+        if character in SPECIAL:
+            return literal(character)
+        raise ValueError("Escape \\{} is not supported.".format(character))
+
+    def character_class(self):
+        if self.peek() == '^':
+            raise ValueError("Negated character classes are not supported.")
+        predicates = []
+        while self.peek() != ']':
+            character = self.next()
+            if character == '\\':
+                predicates.append(self.escape())
+            elif self.peek() == '-' and self.pattern[self.position + 1:self.position + 2] not in ('', ']'):
+                self.next()
+                last = self.next()
+                predicates.append(lambda c, first=character, last=last: first <= c <= last)
+            else:
+                predicates.append(literal(character))
+        self.next()
+        return lambda c: any(predicate(c) for predicate in predicates)
+
+
+def literal(character: str):
+    return lambda c: c == character
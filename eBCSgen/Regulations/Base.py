@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from eBCSgen.TS.State import Memory
+
 
 class BaseRegulation(ABC):
     def __init__(self, regulation):
@@ -8,3 +10,9 @@ class BaseRegulation(ABC):
     @abstractmethod
     def filter(self, current_state, candidates):
         pass
+
+    def create_memory(self) -> Memory:
+        """
+        :return: Memory of the initial state
+        """
+        return Memory(self.memory)
@@ -1,17 +1,28 @@
 import regex
 from eBCSgen.Errors.RegulationParsingError import RegulationParsingError
 
+from eBCSgen.Regulations.Automaton import Automaton
 from eBCSgen.Regulations.Base import BaseRegulation
+from eBCSgen.TS.State import Memory
 
 
 class Regular(BaseRegulation):
     """
     Regulation defined as omega-regular expression (actually not omega for now).
+
+    The expression is compiled to an Automaton and Memory holds only its current state,
+    so states with equivalent histories are identical. If the expression is not supported
+    by Automaton, the whole history is kept and matched by the regex.
     """
     def __init__(self, regulation):
         super(Regular, self).__init__(regulation)
         self.regulation = regex.compile(regulation)
-        self.memory = 2
+        try:
+            self.automaton = Automaton(regulation)
+            self.memory = 3
+        except ValueError:
+            self.automaton = None
+            self.memory = 2
 
     def __str__(self):
         return "RE: " + str(self.regulation)
@@ -21,9 +32,17 @@ class Regular(BaseRegulation):
         return "type regular\n" + "\n".join(self.regulation)
 
     def filter(self, current_state, candidates):
+        if self.automaton:
+            state = current_state.memory.history[0]
+            return {rule: values for rule, values in candidates.items()
+                    if self.automaton.step(state, rule.label) is not None}
+
         path = "".join(current_state.memory.history)
         return {rule: values for rule, values in candidates.items()
                 if self.regulation.fullmatch(path + rule.label, partial=True) is not None}
+
+    def create_memory(self) -> Memory:
+        return Memory(self.memory, self.automaton)
     
     def check_labels(self, model_labels):
         patterns = self.regulation.pattern.replace("(", "").replace(")", "").split("|")
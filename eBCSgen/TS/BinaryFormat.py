@@ -0,0 +1,129 @@
+import json
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+from eBCSgen.TS.State import State, Memory, Vector
+
+# Layout of the binary file:
+#   - MAGIC
+#   - raw arrays, each aligned to ALIGNMENT bytes
+#   - header in JSON (metadata and dtype, shape and offset of each array)
+#   - offset of the header as little-endian uint64
+# Arrays are loaded using np.memmap, so loading does not depend on size of the file.
+# Histories of Memory (regulated models) are stored in CSR format, their distinct items
+# (labels or states of automaton) are listed in the header.
+MAGIC = b"eBCSgTS1"
+ALIGNMENT = 64
+
+
+def write_binary(output_file: str, header: dict, arrays: dict):
+    """
+    Writes given arrays and header to a binary file.
+
+    :param output_file: given file to write to
+    :param header: JSON serializable metadata
+    :param arrays: dict of (name, np.array)
+    """
+    header = dict(header, arrays=dict())
+    with open(output_file, 'wb') as file:
+        file.write(MAGIC)
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            file.write(b"\0" * (-file.tell() % ALIGNMENT))
+            header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': file.tell()}
+            array.tofile(file)
+
+        offset = file.tell()
+        file.write(json.dumps(header).encode())
+        file.write(np.array(offset, dtype='<u8').tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def read_binary(input_file: str):
+    """
+    Reads header and memory-maps arrays of given binary file.
+
+    :param input_file: given binary file
+    :return: header dict and dict of (name, np.memmap)
+    """
+    with open(input_file, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a binary transition system".format(input_file))
+        file.seek(-8, 2)
+        end = file.tell()
+        offset = int(np.frombuffer(file.read(8), dtype='<u8')[0])
+        file.seek(offset)
+        header = json.loads(file.read(end - offset).decode())
+
+    arrays = dict()
+    for name, info in header.pop('arrays').items():
+        shape = tuple(info['shape'])
+        if np.prod(shape) == 0:
+            arrays[name] = np.empty(shape, dtype=info['dtype'])
+        else:
+            arrays[name] = np.memmap(input_file, dtype=info['dtype'], mode='r', offset=info['offset'], shape=shape)
+    return header, arrays
+
+
+def encode_histories(histories: list) -> tuple:
+    """
+    Represents histories of Memory in CSR format.
+
+    :param histories: list of histories (sequences of labels or states of automaton)
+    :return: list of distinct items, array of indices of items and indptr
+        (history i consists of items of values[indptr[i]:indptr[i + 1]])
+    """
+    items = dict()
+    values = [items.setdefault(item, len(items)) for history in histories for item in history]
+    indptr = np.zeros(len(histories) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(history) for history in histories])
+    return list(items), np.array(values, dtype=np.int64), indptr
+
+
+class MappedStates(Mapping):
+    """
+    Read-only encoding code -> State over a (memory-mapped) matrix of vectors.
+
+    Row i corresponds to code first + i, States are created only when requested.
+    For regulated models, histories of Memory are given in CSR format (see encode_histories).
+    """
+    def __init__(self, rows: np.array, first: int = 1, hell: int = None, memory: int = 0, histories: tuple = None):
+        """
+        :param rows: matrix of vectors
+        :param first: code of the first row
+        :param hell: code of the hell state (or None)
+        :param memory: level of Memory
+        :param histories: triple (items, values, indptr) of encoded histories (required if memory > 0)
+        """
+        self.rows = rows
+        self.first = first
+        self.hell = hell
+        self.memory = memory
+        self.histories = histories
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(range(self.first, self.first + len(self.rows)))
+
+    def __getitem__(self, code: int) -> State:
+        if not isinstance(code, (int, np.integer)) or not 0 <= code - self.first < len(self.rows):
+            raise KeyError(code)
+        if code == self.hell:
+            return State(Vector(np.array([np.inf] * self.rows.shape[1])), Memory(0), True)
+        return State(Vector(self.rows[code - self.first].astype(np.int64)), self.get_memory(code - self.first))
+
+    def get_memory(self, row: int) -> Memory:
+        """
+        :param row: index of row
+        :return: Memory with restored history (without automaton, it is given by the regulation)
+        """
+        memory = Memory(self.memory)
+        if self.memory:
+            items, values, indptr = self.histories
+            memory.history = [items[value] for value in values[indptr[row]:indptr[row + 1]].tolist()]
+        return memory
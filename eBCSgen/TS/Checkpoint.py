@@ -0,0 +1,53 @@
+import os
+import time
+
+import numpy as np
+
+POLL_INTERVAL = 0.5  # how often the number of states is checked (in seconds)
+
+
+class Checkpoint:
+    def __init__(self, output_file: str, interval: float = np.inf, size: float = np.inf):
+        """
+        Periodically saves partially generated TransitionSystem to a binary file (see TransitionSystem.save_to_binary),
+        which can be loaded by load_TS_from_binary and continued.
+
+        The file is replaced atomically, so it always contains a complete checkpoint.
+
+        :param output_file: file to write to
+        :param interval: time (in seconds) between two checkpoints
+        :param size: number of newly discovered states between two checkpoints
+        """
+        self.output_file = output_file
+        self.interval = interval
+        self.size = size
+        self.last_time = time.time()
+        self.last_size = 0
+
+    def due(self, ts) -> bool:
+        """
+        :param ts: generated TransitionSystem
+        :return: True if a checkpoint should be created
+        """
+        return time.time() - self.last_time >= self.interval or \
+               len(ts.states_encoding) - self.last_size >= self.size
+
+    def timeout(self) -> float:
+        """
+        :return: time until the checkpoint should be checked again
+        """
+        if self.size != np.inf:
+            return POLL_INTERVAL
+        return max(0, self.last_time + self.interval - time.time())
+
+    def save(self, ts):
+        """
+        Saves the TransitionSystem, it must not be modified in the meantime.
+
+        :param ts: generated TransitionSystem with up to date unprocessed states
+        """
+        temporary_file = self.output_file + ".tmp"
+        ts.save_to_binary(temporary_file, ts.params)
+        os.replace(temporary_file, self.output_file)
+        self.last_time = time.time()
+        self.last_size = len(ts.states_encoding)
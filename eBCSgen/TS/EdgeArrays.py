@@ -0,0 +1,110 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from eBCSgen.TS.Edge import Edge
+
+
+class EdgeArrays:
+    """
+    Read-only collection of encoded Edges stored in CSR arrays.
+
+    Edges leading from the State with code first + i are stored at positions indptr[i]:indptr[i + 1]
+    of targets, probabilities and labels (ordered by targets). Edge objects are created only when iterated.
+    """
+    def __init__(self, indptr: np.array, targets: np.array, probabilities: np.array, labels: np.array,
+                 label_names: list, expressions: dict, first: int = 1):
+        """
+        :param indptr: CSR index pointer
+        :param targets: codes of targets
+        :param probabilities: numeric probabilities (nan for parametric ones)
+        :param labels: indices to label_names (-1 for no label)
+        :param label_names: list of labels
+        :param expressions: dict of (position, parametric probability)
+        :param first: code of the first State
+        """
+        self.indptr = indptr
+        self.targets = targets
+        self.probabilities = probabilities
+        self.labels = labels
+        self.label_names = label_names
+        self.expressions = expressions
+        self.first = first
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __iter__(self):
+        for row in range(len(self.indptr) - 1):
+            for i in range(self.indptr[row], self.indptr[row + 1]):
+                label = self.label_names[self.labels[i]] if self.labels[i] >= 0 else None
+                probability = self.expressions.get(i, float(self.probabilities[i]))
+                yield Edge(self.first + row, int(self.targets[i]), probability, label, encoded=True)
+
+    @property
+    def sources(self) -> np.array:
+        """
+        :return: codes of sources (parallel to targets)
+        """
+        return np.repeat(np.arange(self.first, self.first + len(self.indptr) - 1), np.diff(self.indptr))
+
+    def to_csr(self) -> csr_matrix:
+        """
+        Creates sparse matrix of probabilities indexed directly by codes of States.
+
+        Parametric probabilities are nan, the order of stored values corresponds to the arrays
+        (see label_array and expression_array).
+
+        :return: square CSR matrix
+        """
+        size = self.first + len(self.indptr) - 1
+        indptr = np.concatenate([np.zeros(self.first, dtype=np.int64), self.indptr])
+        return csr_matrix((self.probabilities, self.targets, indptr), shape=(size, size))
+
+    def label_array(self) -> np.array:
+        """
+        :return: object array of labels of Edges (None for no label)
+        """
+        return np.array(self.label_names + [None], dtype=object)[self.labels]
+
+    def expression_array(self) -> np.array:
+        """
+        :return: object array of parametric probabilities of Edges (None for numeric ones)
+        """
+        result = np.full(len(self.targets), None, dtype=object)
+        for i, expression in self.expressions.items():
+            result[i] = expression
+        return result
+
+
+def edges_to_arrays(edges, first: int, size: int) -> EdgeArrays:
+    """
+    Stores given encoded Edges in EdgeArrays.
+
+    Edges are ordered using NumPy on their codes, Edge objects are never sorted.
+
+    :param edges: iterable of encoded Edges
+    :param first: code of the first State
+    :param size: number of States
+    :return: EdgeArrays
+    """
+    edges = list(edges)
+    sources = np.fromiter((edge.source for edge in edges), dtype=np.int64, count=len(edges))
+    targets = np.fromiter((edge.target for edge in edges), dtype=np.int64, count=len(edges))
+    order = np.lexsort((targets, sources))
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources - first, minlength=size), out=indptr[1:])
+
+    label_names = sorted({edge.label for edge in edges if edge.label is not None})
+    label_ids = {label: i for i, label in enumerate(label_names)}
+    labels = np.fromiter((label_ids.get(edges[i].label, -1) for i in order), dtype=np.int32, count=len(edges))
+
+    expressions = dict()
+    probabilities = np.empty(len(edges), dtype=np.float64)
+    for position, i in enumerate(order):
+        try:
+            probabilities[position] = edges[i].probability
+        except (TypeError, ValueError):
+            probabilities[position] = np.nan
+            expressions[position] = str(edges[i].probability)
+
+    return EdgeArrays(indptr, targets[order], probabilities, labels, label_names, expressions, first)
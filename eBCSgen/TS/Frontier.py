@@ -0,0 +1,112 @@
+import collections
+import threading
+
+
+class Frontier:
+    """
+    Thread-safe queue of codes of unprocessed States shared by TSworkers.
+
+    Workers take States in batches. Generating is finished when the queue is empty and no worker
+    is processing a batch, or when the frontier was explicitly stopped.
+
+    The frontier can be paused (e.g. to create a checkpoint), then workers return the rest of their
+    batches and no worker is busy until it is resumed.
+    """
+    def __init__(self, codes=()):
+        self.queue = collections.deque(codes)
+        self.condition = threading.Condition()
+        self.busy = 0  # number of workers processing a batch
+        self.stopped = False
+        self.paused = False
+        self.finished = threading.Event()
+        if not self.queue:
+            self.finished.set()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def put(self, codes: list):
+        """
+        Adds codes of newly discovered States.
+
+        :param codes: given codes
+        """
+        if codes:
+            with self.condition:
+                self.queue.extend(codes)
+                self.condition.notify(len(codes))
+
+    def get(self, size: int) -> list:
+        """
+        Takes a batch of codes, blocks until some are available.
+
+        :param size: maximal size of the batch
+        :return: list of codes, empty if generating is finished
+        """
+        with self.condition:
+            while (not self.queue or self.paused) and not self.finished.is_set():
+                self.condition.wait()
+            if self.finished.is_set():
+                return []
+            batch = [self.queue.popleft() for _ in range(min(size, len(self.queue)))]
+            self.busy += 1
+            return batch
+
+    def done(self, leftover: list = ()):
+        """
+        Marks the batch taken by a worker as processed.
+
+        :param leftover: codes from the batch which were not processed
+        """
+        with self.condition:
+            self.queue.extendleft(reversed(leftover))
+            self.busy -= 1
+            if not self.queue and self.busy == 0:
+                self._finish()
+            elif self.paused:
+                self.condition.notify_all()
+
+    def stop(self):
+        """
+        Stops generating, workers finish the currently processed State and return the rest of their batch.
+        """
+        with self.condition:
+            self.stopped = True
+            self._finish()
+
+    def pause(self):
+        """
+        Pauses generating, blocks until all workers finish the currently processed State and return the rest of their batch.
+        """
+        with self.condition:
+            self.paused = True
+            while self.busy and not self.finished.is_set():
+                self.condition.wait()
+
+    def resume(self):
+        """
+        Resumes paused generating.
+        """
+        with self.condition:
+            self.paused = False
+            self.condition.notify_all()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Blocks until generating is finished.
+
+        :param timeout: maximal time to wait
+        :return: True if finished, False in the case of timeout
+        """
+        return self.finished.wait(timeout)
+
+    def remaining(self) -> set:
+        """
+        :return: set of codes of States which were not processed
+        """
+        with self.condition:
+            return set(self.queue)
+
+    def _finish(self):
+        self.finished.set()
+        self.condition.notify_all()
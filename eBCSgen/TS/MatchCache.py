@@ -0,0 +1,92 @@
+import collections
+
+from eBCSgen.Core.Interning import BoundedCache
+
+
+class MatchCache:
+    """
+    Incremental computation of rates and matches of rules in states of the direct (multiset) TS.
+
+    A successor differs from its parent only in complexes changed by a single rule application.
+    Each rule depends on complexes compatible with its LHS patterns or agents of its rate,
+    other complexes affect neither its matches nor its rate. When a successor is created,
+    rules affected by the changed complexes are recorded together with the results of the parent,
+    so only these rules are matched again when the successor is processed.
+
+    Rules are expected to have lhs and rate_agents precomputed.
+    """
+    def __init__(self, rules: list, definitions: dict, size: int = 2 ** 16):
+        self.rules = list(rules)
+        self.definitions = definitions
+        self.size = size
+        self.patterns = [list(rule.lhs.agents) + list(rule.rate_agents) for rule in self.rules]
+        self.dependencies = dict()  # ID of complex -> indices of rules depending on it
+        self.inherited = BoundedCache(size)  # content of successor -> (results of parent, affected rules)
+
+    def __getstate__(self):
+        # the cache is local to a process
+        return {'rules': self.rules, 'definitions': self.definitions, 'size': self.size}
+
+    def __setstate__(self, state):
+        self.__init__(state['rules'], state['definitions'], state['size'])
+
+    def affected_rules(self, complex) -> frozenset:
+        """
+        :param complex: given Complex
+        :return: indices of rules whose matches or rate depend on the complex
+        """
+        key = complex.intern()
+        if key not in self.dependencies:
+            self.dependencies[key] = frozenset(i for i, patterns in enumerate(self.patterns)
+                                               if any(pattern.compatible(complex) for pattern in patterns))
+        return self.dependencies[key]
+
+    def compute(self, state) -> list:
+        """
+        Computes rates and matches of all rules in given state, results of the parent are
+        reused for rules which are not affected by the changed complexes.
+
+        :param state: given State
+        :return: list of (rate, matches) for each rule, None if the rule cannot be used
+        """
+        parent, affected = self.inherited.pop(state.content, (None, None))
+        results = []
+        for i, rule in enumerate(self.rules):
+            if parent is not None and i not in affected:
+                results.append(parent[i])
+                continue
+
+            rate = rule.evaluate_rate(state, self.definitions)
+            matches = rule.match(state, all=True)
+
+            try:
+                rate = rate if rate > 0 else None
+            except TypeError:
+                pass
+
+            # drop rules which cannot be actually used (0 rate or no matches)
+            results.append((rate, matches) if matches is not None and rate is not None else None)
+        return results
+
+    def inherit(self, results: list, parent, successor):
+        """
+        Records results of the parent for given successor.
+
+        :param results: results of the parent (see compute)
+        :param parent: parent State
+        :param successor: successor State
+        """
+        changed = collections.Counter(parent.content.value)
+        changed.subtract(successor.content.value)
+        affected = set()
+        for complex, difference in changed.items():
+            if difference:
+                affected |= self.affected_rules(complex)
+        self.inherited.add(successor.content, (results, affected))
+
+    def candidates(self, results: list) -> dict:
+        """
+        :param results: results of a state (see compute)
+        :return: dict of (rule, (rate, matches)) of rules which can be used
+        """
+        return {rule: result for rule, result in zip(self.rules, results) if result is not None}
@@ -0,0 +1,589 @@
+import collections
+import math
+import multiprocessing
+
+import numpy as np
+import sympy
+
+from eBCSgen.TS.State import State, Memory, Vector
+
+CHUNK = 10  # number of runs simulated in a single task
+
+# state of the worker process, set once by init_worker
+_worker = dict()
+
+
+class JoinedRates:
+    """
+    Compiled rates (or other vectorized expressions) joined to a single numeric function.
+
+    Placeholders of agents are renamed to be unique among all rates and vectors of agents are
+    stacked to a single matrix, so values of all rates in a state are obtained by a single
+    matrix product and a single function call.
+    """
+    def __init__(self, rates: list, size: int):
+        """
+        :param rates: vectorized Rates
+        :param size: length of states
+        """
+        self.rates = rates
+        vectors, symbols, expressions = [], [], []
+        for rate in rates:
+            if rate.template is None:
+                rate.compile()
+            if rate.params:
+                raise ValueError("Expression {} contains unspecified parameters {}.".format(rate, rate.params))
+
+            names = dict()
+            for symbol, vector in zip(rate.symbols, rate.agents):
+                names[symbol] = sympy.Symbol("__value{}".format(len(vectors)))
+                symbols.append(names[symbol])
+                vectors.append(vector)
+            # renaming must not simplify the expression (see Rate.compile)
+            with sympy.evaluate(False):
+                expressions.append(rate.template.xreplace(names))
+
+        self.agents = np.array(vectors, dtype=float).reshape(len(vectors), size)
+        self.function = sympy.lambdify(symbols, expressions, modules="math")
+
+    def evaluate(self, values: np.array) -> np.array:
+        """
+        Evaluates all rates in given state. If the joined function fails (e.g. division by zero),
+        the rates are evaluated one by one.
+
+        :param values: vector of the state
+        :return: vector of values of rates, nan for undefined results
+        """
+        try:
+            return np.array(self.function(*(self.agents @ values).tolist()), dtype=float)
+        except (ArithmeticError, ValueError):
+            state = State(Vector(values), Memory(0))
+            return np.array([to_float(rate.evaluate(state)) for rate in self.rates], dtype=float)
+
+
+class SSA:
+    """
+    Gillespie stochastic simulation algorithm (direct method) working on stoichiometry matrices.
+
+    Rates of all reactions are joined (see JoinedRates), so the propensity vector of a state
+    is obtained by a single matrix product and a single function call. Trajectories are written to preallocated buffers of given time points and random numbers
+    are drawn in blocks from a NumPy Generator.
+    """
+    BLOCK = 4096  # number of random numbers drawn at once and initial size of buffers
+
+    def __init__(self, vector_model, observables: bool = False):
+        """
+        :param vector_model: given VectorModel (its rates have to be numeric)
+        :param observables: record values of observables of the model instead of the states
+        """
+        self.init = np.array(vector_model.init.content.value, dtype=np.int64)
+        self.reactions = vector_model.reactions
+        self.reactants = vector_model.reactants
+        self.delta = vector_model.delta
+        self.rates = JoinedRates([reaction.rate for reaction in self.reactions], len(self.init))
+
+        if observables:
+            self.observables = JoinedRates(list(vector_model.observables.values()), len(self.init))
+            self.header = list(vector_model.observables)
+        else:
+            self.observables = None
+            self.header = list(map(str, vector_model.ordering))
+
+    def propensities(self, values: np.array) -> np.array:
+        """
+        Computes rates of all reactions in given state.
+
+        Rates of reactions which are not enabled (not enough reactants), non-positive
+        and undefined rates are 0.
+
+        :param values: vector of the state
+        :return: vector of rates (in the order of self.reactions)
+        """
+        rates = self.rates.evaluate(values)
+        usable = (values >= self.reactants).all(1) & (rates > 0) & (rates < math.inf)
+        return np.where(usable, rates, 0.0)
+
+    def observe(self, values: np.array) -> np.array:
+        """
+        :param values: vector of the state
+        :return: recorded values (the state itself or values of observables)
+        """
+        return values if self.observables is None else self.observables.evaluate(values)
+
+    def sample(self, times: np.array, rng: np.random.Generator, fixed_step: float = None) -> np.array:
+        """
+        Simulates a single trajectory from the initial state and records it at given time points.
+
+        In each step a reaction is chosen with probability proportional to its rate and applied,
+        the time is increased by exponentially distributed waiting time. Each time point gets
+        the state valid at that time, so the memory is bounded by the number of time points.
+        A state in which no reaction can be used is kept forever.
+
+        :param times: increasing time points
+        :param rng: NumPy random Generator
+        :param fixed_step: fixed time step used instead of random waiting times (for testing)
+        :return: matrix of states or values of observables (one row per time point)
+        """
+        result = np.empty((len(times), len(self.header)), dtype=np.int64 if self.observables is None else float)
+        values = self.init.copy()
+        time = 0.0
+        fired = 0
+        recorded = 0
+        drawn = self.BLOCK
+
+        while True:
+            cumulative = self.propensities(values).cumsum()
+            total = cumulative[-1] if len(cumulative) else 0.0
+
+            if drawn == self.BLOCK:
+                uniform = rng.random(self.BLOCK)
+                exponential = rng.standard_exponential(self.BLOCK)
+                drawn = 0
+
+            if total > 0:
+                # multiples of the fixed step are not accumulated, so they match the time points exactly
+                time = (fired + 1) * fixed_step if fixed_step else time + exponential[drawn] / total
+            else:
+                time = math.inf
+
+            # the current state is valid until the next reaction
+            end = times.searchsorted(time, side="left")
+            if end > recorded:
+                result[recorded:end] = self.observe(values)
+                recorded = end
+            if recorded == len(times):
+                return result
+
+            values += self.delta[cumulative.searchsorted(uniform[drawn] * total, side="right")]
+            drawn += 1
+            fired += 1
+
+
+class NextReactionMethod(SSA):
+    """
+    Next reaction method (Gibson and Bruck) for large sparse reaction networks.
+
+    Each reaction has its putative firing time kept in an indexed priority queue, the earliest one
+    is fired. Then only propensities of reactions depending on species changed by the fired
+    reaction are recomputed (see dependencies) and their putative times are rescaled.
+    """
+    def __init__(self, vector_model, observables: bool = False):
+        """
+        :param vector_model: given VectorModel (its rates have to be numeric)
+        :param observables: record values of observables of the model instead of the states
+        """
+        super(NextReactionMethod, self).__init__(vector_model, observables)
+        self.inputs = []  # reaction -> (species read by the rate, their weights, numeric function)
+        self.needed = []  # reaction -> (species of reactants, their counts)
+        for i, rate in enumerate(self.rates.rates):
+            columns = np.flatnonzero(np.any(rate.agents.reshape(-1, len(self.init)), axis=0))
+            self.inputs.append((columns, rate.agents.reshape(-1, len(self.init))[:, columns], rate.get_function()))
+            reactants = np.flatnonzero(self.reactants[i])
+            self.needed.append((reactants, self.reactants[i, reactants]))
+        self.dependencies = self.create_dependencies()
+
+    def create_dependencies(self) -> list:
+        """
+        Creates the dependency graph of reactions.
+
+        A reaction depends on species of its reactants and agents of its rate,
+        it is affected by every reaction changing some of these species.
+
+        :return: list of affected reactions for each reaction (including the reaction itself)
+        """
+        readers = collections.defaultdict(set)  # species -> reactions depending on it
+        for i, ((columns, _, _), (reactants, _)) in enumerate(zip(self.inputs, self.needed)):
+            for species in set(columns) | set(reactants):
+                readers[species].add(i)
+
+        dependencies = []
+        for i in range(len(self.reactions)):
+            affected = {i}
+            for species in np.flatnonzero(self.delta[i]):
+                affected |= readers[species]
+            dependencies.append(sorted(affected))
+        return dependencies
+
+    def propensity(self, reaction: int, values: np.array) -> float:
+        """
+        Computes rate of a single reaction in given state, see SSA.propensities.
+
+        :param reaction: index of the reaction
+        :param values: vector of the state
+        :return: rate of the reaction
+        """
+        reactants, counts = self.needed[reaction]
+        if np.any(values[reactants] < counts):
+            return 0.0
+
+        columns, weights, function = self.inputs[reaction]
+        try:
+            rate = function(*(weights @ values[columns]).tolist())
+        except (ArithmeticError, ValueError):
+            rate = to_float(self.rates.rates[reaction].evaluate(State(Vector(values), Memory(0))))
+        return rate if 0 < rate < math.inf else 0.0
+
+    def sample(self, times: np.array, rng: np.random.Generator, fixed_step: float = None) -> np.array:
+        """
+        Simulates a single trajectory from the initial state and records it at given time points.
+
+        :param times: increasing time points
+        :param rng: NumPy random Generator
+        :param fixed_step: not supported by this method (kept for the common interface)
+        :return: matrix of states or values of observables (one row per time point)
+        """
+        result = np.empty((len(times), len(self.header)), dtype=np.int64 if self.observables is None else float)
+        values = self.init.copy()
+        recorded = 0
+        draws = exponentials(rng, self.BLOCK)
+
+        rates = self.propensities(values).tolist()
+        queue = IndexedPriorityQueue([next(draws) / rate if rate > 0 else math.inf for rate in rates])
+
+        while True:
+            fired, time = queue.top()
+
+            # the current state is valid until the next reaction
+            end = times.searchsorted(time, side="left")
+            if end > recorded:
+                result[recorded:end] = self.observe(values)
+                recorded = end
+            if recorded == len(times):
+                return result
+
+            values += self.delta[fired]
+            for i in self.dependencies[fired]:
+                old, rates[i] = rates[i], self.propensity(i, values)
+                if rates[i] == 0:
+                    queue.update(i, math.inf)
+                elif i == fired or old == 0:
+                    queue.update(i, time + next(draws) / rates[i])
+                elif rates[i] != old:
+                    queue.update(i, time + old / rates[i] * (queue.keys[i] - time))
+
+
+class TauLeaping(SSA):
+    """
+    Adaptive tau-leaping (Cao, Gillespie and Petzold) for models with large numbers of molecules.
+
+    In each leap, numbers of firings of all reactions within the step are drawn from Poisson distribution.
+    The step is chosen so that the expected relative change of propensities is bounded by EPSILON.
+    Critical reactions (which could exhaust some of their reactants) fire at most once per leap.
+    When the step would be too small (low counts), a number of exact steps is executed instead.
+    """
+    EPSILON = 0.03  # bound on relative change of propensities within a leap
+    CRITICAL = 10  # reactions which can fire fewer times (before exhausting reactants) are critical
+    THRESHOLD = 10  # leaping is used only for steps longer than THRESHOLD / (sum of rates)
+    EXACT_STEPS = 100  # number of exact steps executed instead of a too short leap
+
+    def __init__(self, vector_model, observables: bool = False):
+        """
+        :param vector_model: given VectorModel (its rates have to be numeric)
+        :param observables: record values of observables of the model instead of the states
+        """
+        super(TauLeaping, self).__init__(vector_model, observables)
+        self.consumption = np.maximum(-self.delta, 0)
+
+        # highest order of reactions consuming each species and the number of its copies required there
+        orders = self.reactants.sum(axis=1)[:, np.newaxis]
+        required = self.reactants > 0
+        self.orders = np.max(np.where(required, orders, 0), axis=0, initial=0)
+        self.copies = np.max(np.where(required & (orders == self.orders), self.reactants, 0), axis=0, initial=0)
+        self.reactant_species = self.orders > 0
+
+    def critical(self, values: np.array, rates: np.array) -> np.array:
+        """
+        :param values: vector of the state
+        :param rates: vector of rates of reactions
+        :return: mask of critical reactions
+        """
+        with np.errstate(divide="ignore"):
+            firings = np.where(self.consumption > 0, values // np.maximum(self.consumption, 1), math.inf)
+        return (rates > 0) & (firings.min(axis=1, initial=math.inf) < self.CRITICAL)
+
+    def leap_bound(self, values: np.array, rates: np.array, critical: np.array) -> float:
+        """
+        Computes the longest step for which the expected change (mean and deviation)
+        of each reactant species caused by non-critical reactions is bounded.
+
+        :param values: vector of the state
+        :param rates: vector of rates of reactions
+        :param critical: mask of critical reactions
+        :return: the step (infinity if not bounded)
+        """
+        noncritical = np.where(critical, 0.0, rates)
+        mean = noncritical @ self.delta
+        variance = noncritical @ self.delta ** 2
+
+        x = values.astype(float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            g = self.orders.astype(float)
+            g = np.where((self.orders == 2) & (self.copies == 2), 2 + 1 / (x - 1), g)
+            g = np.where((self.orders == 3) & (self.copies == 2), 1.5 * (2 + 1 / (x - 1)), g)
+            g = np.where((self.orders == 3) & (self.copies == 3), 3 + 1 / (x - 1) + 2 / (x - 2), g)
+            allowed = np.maximum(self.EPSILON * x / g, 1)[self.reactant_species]
+            bounds = np.minimum(allowed / np.abs(mean[self.reactant_species]),
+                                allowed ** 2 / variance[self.reactant_species])
+        return bounds.min(initial=math.inf)
+
+    def leap(self, values: np.array, rates: np.array, critical: np.array, bound: float,
+             rng: np.random.Generator) -> tuple:
+        """
+        Draws firings of reactions within a leap. If some species would become negative,
+        the leap is rejected and the bound is halved.
+
+        :param values: vector of the state
+        :param rates: vector of rates of reactions
+        :param critical: mask of critical reactions
+        :param bound: step bound for non-critical reactions
+        :param rng: NumPy random Generator
+        :return: the step and the change of the state
+        """
+        critical_rates = np.where(critical, rates, 0.0).cumsum()
+        while True:
+            critical_step = rng.standard_exponential() / critical_rates[-1] if critical_rates[-1] > 0 else math.inf
+            step = min(bound, critical_step)
+            firings = np.where(critical, 0, rng.poisson(np.where(critical, 0.0, rates) * step))
+            if critical_step <= bound:
+                firings[critical_rates.searchsorted(rng.random() * critical_rates[-1], side="right")] += 1
+
+            change = firings @ self.delta
+            if np.all(values + change >= 0):
+                return step, change
+            bound /= 2
+
+    def sample(self, times: np.array, rng: np.random.Generator, fixed_step: float = None) -> np.array:
+        """
+        Simulates a single trajectory from the initial state and records it at given time points.
+
+        :param times: increasing time points
+        :param rng: NumPy random Generator
+        :param fixed_step: not supported by this method (kept for the common interface)
+        :return: matrix of states or values of observables (one row per time point)
+        """
+        result = np.empty((len(times), len(self.header)), dtype=np.int64 if self.observables is None else float)
+        values = self.init.copy()
+        time = 0.0
+        recorded = 0
+        exact = 0  # number of remaining exact steps
+
+        while True:
+            cumulative = self.propensities(values).cumsum()
+            total = cumulative[-1] if len(cumulative) else 0.0
+
+            if total == 0:
+                step, change = math.inf, 0
+            else:
+                if not exact:
+                    rates = np.diff(cumulative, prepend=0.0)
+                    critical = self.critical(values, rates)
+                    bound = self.leap_bound(values, rates, critical)
+                    if bound < self.THRESHOLD / total or (bound == math.inf and not critical.any()):
+                        exact = self.EXACT_STEPS
+
+                if exact:
+                    exact -= 1
+                    step = rng.standard_exponential() / total
+                    change = self.delta[cumulative.searchsorted(rng.random() * total, side="right")]
+                else:
+                    step, change = self.leap(values, rates, critical, bound, rng)
+
+            # the current state is valid until the end of the step
+            end = times.searchsorted(time + step, side="left")
+            if end > recorded:
+                result[recorded:end] = self.observe(values)
+                recorded = end
+            if recorded == len(times):
+                return result
+
+            values += change
+            time += step
+
+
+class IndexedPriorityQueue:
+    """
+    Binary heap of items 0..n-1 ordered by their keys, the key of any item can be changed.
+    Position of each item in the heap is tracked, so the item is found in constant time.
+    """
+    def __init__(self, keys: list):
+        self.keys = list(keys)
+        self.heap = sorted(range(len(self.keys)), key=self.keys.__getitem__)  # sorted list is a heap
+        self.position = [0] * len(self.keys)
+        for i, item in enumerate(self.heap):
+            self.position[item] = i
+
+    def top(self) -> tuple:
+        """
+        :return: item with the smallest key and the key (None and infinity if empty)
+        """
+        if not self.heap:
+            return None, math.inf
+        return self.heap[0], self.keys[self.heap[0]]
+
+    def update(self, item: int, key: float):
+        """
+        :param item: given item
+        :param key: new key of the item
+        """
+        old, self.keys[item] = self.keys[item], key
+        if key < old:
+            self.sift_up(self.position[item])
+        elif key > old:
+            self.sift_down(self.position[item])
+
+    def sift_up(self, i: int):
+        heap, keys = self.heap, self.keys
+        while i > 0:
+            parent = (i - 1) // 2
+            if keys[heap[parent]] <= keys[heap[i]]:
+                break
+            self.swap(i, parent)
+            i = parent
+
+    def sift_down(self, i: int):
+        heap, keys = self.heap, self.keys
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap) and keys[heap[child]] < keys[heap[smallest]]:
+                    smallest = child
+            if smallest == i:
+                break
+            self.swap(i, smallest)
+            i = smallest
+
+    def swap(self, i: int, j: int):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.position[heap[i]] = i
+        self.position[heap[j]] = j
+
+
+class Statistics:
+    """
+    Streaming mean and variance of equally shaped arrays (Welford's algorithm).
+
+    Statistics computed independently (e.g. in other processes) can be merged.
+    """
+    def __init__(self, shape: tuple):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)  # sum of squared differences from the mean
+
+    def add(self, values: np.array):
+        """
+        :param values: new sample
+        """
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+    def merge(self, other: 'Statistics'):
+        """
+        :param other: Statistics of other samples
+        """
+        count = self.count + other.count
+        if other.count:
+            delta = other.mean - self.mean
+            self.mean += delta * (other.count / count)
+            self.m2 += other.m2 + delta ** 2 * (self.count * other.count / count)
+            self.count = count
+
+    @property
+    def variance(self) -> np.array:
+        """
+        :return: sample variance (0 for less than two samples)
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else np.zeros(self.mean.shape)
+
+
+# simulation engines by name of the method
+ENGINES = {"direct": SSA, "next_reaction": NextReactionMethod, "tau_leaping": TauLeaping}
+
+
+def to_float(value) -> float:
+    """
+    :param value: result of Rate.evaluate
+    :return: float value, nan for undefined results
+    """
+    try:
+        return float(value)
+    except TypeError:
+        return math.nan
+
+
+def exponentials(rng: np.random.Generator, block: int):
+    """
+    :param rng: NumPy random Generator
+    :param block: number of random numbers drawn at once
+    :return: infinite generator of exponentially distributed numbers (with rate 1)
+    """
+    while True:
+        yield from rng.standard_exponential(block).tolist()
+
+
+def init_worker(vector_model, observables: bool, method: str):
+    """
+    Prepares the simulation engine in the worker process, so it is not sent with every task.
+    """
+    _worker['engine'] = ENGINES[method](vector_model, observables)
+
+
+def simulate_chunk(task: tuple) -> Statistics:
+    """
+    Simulates a chunk of runs in the worker process.
+
+    :param task: triple (seeds, times, fixed_step), see simulate_runs
+    :return: Statistics of the runs
+    """
+    return simulate_runs(_worker['engine'], *task)
+
+
+def simulate_runs(engine: SSA, seeds: list, times: np.array, fixed_step: float = None) -> Statistics:
+    """
+    :param engine: simulation engine
+    :param seeds: SeedSequence for each run
+    :param times: time points where runs are recorded
+    :param fixed_step: fixed time step (for testing)
+    :return: Statistics of the runs
+    """
+    statistics = Statistics((len(times), len(engine.header)))
+    for seed in seeds:
+        statistics.add(engine.sample(times, np.random.default_rng(seed), fixed_step))
+    return statistics
+
+
+def simulate_ensemble(vector_model, times: np.array, runs: int, seed: int = None, processes: int = None,
+                      fixed_step: float = None, observables: bool = False, method: str = "direct") -> Statistics:
+    """
+    Simulates an ensemble of independent runs and computes their mean and variance at given time points.
+
+    Each run has its own random Generator spawned from a single SeedSequence. Runs are split to chunks
+    of fixed size independently of the number of processes and the chunks are merged in fixed order,
+    so the result is given only by the seed.
+
+    :param vector_model: given VectorModel
+    :param times: increasing time points where runs are recorded
+    :param runs: number of runs
+    :param seed: entropy of the SeedSequence (random if not given)
+    :param processes: number of worker processes (serial if not given)
+    :param fixed_step: fixed time step used instead of random waiting times (for testing)
+    :param observables: record values of observables of the model instead of the states
+    :param method: simulation engine (see ENGINES)
+    :return: Statistics of all runs
+    """
+    seeds = np.random.SeedSequence(seed).spawn(runs)
+    tasks = [(seeds[i:i + CHUNK], times, fixed_step) for i in range(0, runs, CHUNK)]
+    width = len(vector_model.observables) if observables else len(vector_model.init.content)
+    statistics = Statistics((len(times), width))
+
+    if processes:
+        with multiprocessing.Pool(processes, init_worker, (vector_model, observables, method)) as pool:
+            for result in pool.imap(simulate_chunk, tasks):
+                statistics.merge(result)
+    else:
+        engine = ENGINES[method](vector_model, observables)
+        for task in tasks:
+            statistics.merge(simulate_runs(engine, *task))
+    return statistics
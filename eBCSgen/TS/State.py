@@ -5,15 +5,22 @@ import numpy as np
 
 
 class Memory:
-    def __init__(self, level: int):
+    def __init__(self, level: int, automaton=None):
+        """
+        :param level: 0 - no memory, 1 - last label, 2 - all labels, 3 - state of automaton
+        :param automaton: Automaton of Regular regulation (level 3), history contains only its current state
+        """
         self.level = level
         self.history = []
+        self.automaton = automaton
+        if automaton:
+            self.history = [automaton.initial]
 
     def __eq__(self, other: 'Memory') -> bool:
         return self.level == other.level and self.history == other.history
 
     def __copy__(self):
-        mem = Memory(self.level)
+        mem = Memory(self.level, self.automaton)
         mem.history = copy(self.history)
         return mem
 
@@ -25,6 +32,8 @@ class Memory:
             self.history = [label]
         elif self.level == 2:
             self.history.append(label)
+        elif self.level == 3:
+            self.history = [self.automaton.step(self.history[0], label)]
 
 
 class Vector:
@@ -0,0 +1,133 @@
+import threading
+from copy import copy
+from collections.abc import Mapping
+
+import numpy as np
+
+from eBCSgen.TS.State import State, Memory, Vector
+
+
+class StateStore(Mapping):
+    """
+    Storage of discovered States which assigns each State its unique code at the moment of discovery.
+
+    Behaves as a read-only dict code -> State (compatible with TransitionSystem.states_encoding).
+    Codes are dense and start from 1 (as in the original encoding of transition systems).
+    Adding of States is thread-safe.
+    """
+    def __init__(self):
+        self.index = dict()  # key -> code
+        self.lock = threading.Lock()
+        self.count = 0
+        self.states = []
+
+    def __str__(self):
+        return str(dict(self.items()))
+
+    def __repr__(self):
+        return str(self)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(range(1, self.count + 1))
+
+    def __getitem__(self, code: int) -> State:
+        if not isinstance(code, (int, np.integer)) or not 0 < code <= self.count:
+            raise KeyError(code)
+        return self.get_state(code)
+
+    def add(self, state: State):
+        """
+        Adds given State to the store (if not present yet).
+
+        :param state: given State
+        :return: code of the State and bool indicating whether it was newly added
+        """
+        key = self.key(state)
+        with self.lock:
+            code = self.index.get(key)
+            if code is not None:
+                return code, False
+            code = self.count + 1
+            self.store_state(state, code)
+            self.index[key] = code
+            self.count = code
+            return code, True
+
+    def code(self, state: State):
+        """
+        :param state: given State
+        :return: code of the State or None if not present
+        """
+        return self.index.get(self.key(state))
+
+    def key(self, state: State):
+        return state
+
+    def store_state(self, state: State, code: int):
+        self.states.append(state)
+
+    def get_state(self, code: int) -> State:
+        return self.states[code - 1]
+
+
+class VectorStore(StateStore):
+    """
+    StateStore for vector States.
+
+    Vectors are stored as rows of small unsigned ints in a growable NumPy buffer and
+    indexed by their bytes. States are reconstructed only when requested.
+    """
+    def __init__(self, size: int, bound, memory: Memory = None, capacity: int = 1024):
+        """
+        :param size: length of vectors (i.e. length of ordering)
+        :param bound: maximal value in the vectors
+        :param memory: Memory of the initial state (determines Memory used by regulation)
+        :param capacity: initial number of rows
+        """
+        super(VectorStore, self).__init__()
+        self.size = size
+        self.prototype = memory if memory else Memory(0)
+        self.memory = self.prototype.level
+        self.dtype = np.min_scalar_type(int(bound) + 1)
+        self.rows = np.zeros((capacity, size), dtype=self.dtype)
+        self.histories = []
+        self.hell = None  # code of the special hell state
+
+    @property
+    def vectors(self) -> np.array:
+        """
+        :return: view of all stored vectors (row i corresponds to code i + 1)
+        """
+        return self.rows[:self.count]
+
+    def key(self, state: State):
+        if state.is_hell:
+            return None
+        row = state.content.value.astype(self.dtype).tobytes()
+        if self.memory:
+            return row, tuple(state.memory.history)
+        return row
+
+    def store_state(self, state: State, code: int):
+        if code > len(self.rows):
+            rows = np.zeros((2 * len(self.rows), self.size), dtype=self.dtype)
+            rows[:len(self.rows)] = self.rows
+            self.rows = rows
+
+        if state.is_hell:
+            self.hell = code
+        else:
+            self.rows[code - 1] = state.content.value
+        if self.memory:
+            self.histories.append(tuple(state.memory.history))
+
+    def get_state(self, code: int) -> State:
+        if code == self.hell:
+            return State(Vector(np.array([np.inf] * self.size)), Memory(0), True)
+        memory = copy(self.prototype)
+        if self.memory:
+            memory.history = list(self.histories[code - 1])
+        return State(Vector(self.rows[code - 1].astype(np.int64)), memory)
@@ -0,0 +1,145 @@
+import collections
+from copy import copy
+import math
+import multiprocessing
+import time
+
+import numpy as np
+
+from eBCSgen.TS.Edge import Edge
+from eBCSgen.TS.State import State, Memory, Vector, Multiset
+
+# state of the worker process, set once by init_worker
+_worker = dict()
+
+
+class StateCodec:
+    def __init__(self, vector: bool, size: int, memory: Memory):
+        """
+        Translates States to compact tuples which are sent between processes.
+
+        Vector content is sent as a tuple of ints, Multiset content as a tuple of (Complex, count) pairs.
+        The special hell state is sent as None.
+
+        :param vector: True if states are in vector representation
+        :param size: length of vectors (ignored for multisets)
+        :param memory: Memory of the initial state (determines Memory used by regulation)
+        """
+        self.vector = vector
+        self.size = size
+        self.memory = memory
+
+    def encode(self, state: State):
+        if state.is_hell:
+            return None
+        if self.vector:
+            content = tuple(int(value) for value in state.content.value)
+        else:
+            content = tuple(state.content.value.items())
+        return content, tuple(state.memory.history)
+
+    def decode(self, data) -> State:
+        if data is None:
+            if self.vector:
+                return State(Vector(np.array([np.inf] * self.size)), Memory(0), True)
+            return State(Multiset(collections.Counter()), Memory(0), True)
+
+        content, history = data
+        if self.vector:
+            content = Vector(np.array(content))
+        else:
+            content = Multiset(collections.Counter(dict(content)))
+        memory = copy(self.memory)
+        memory.history = list(history)
+        return State(content, memory)
+
+
+def init_worker(model, bound, codec):
+    """
+    Stores the model in the worker process, so it is not sent with every chunk.
+    """
+    _worker['model'] = model
+    _worker['bound'] = bound
+    _worker['codec'] = codec
+
+
+def explore_chunk(chunk: list) -> list:
+    """
+    Processes a chunk of encoded states in the worker process, rates are evaluated for the whole chunk at once.
+
+    :param chunk: list of pairs (code, encoded State)
+    :return: list of pairs (code, list of (encoded target, probability, label))
+    """
+    codec = _worker['codec']
+    states = [codec.decode(data) for _, data in chunk]
+    results = []
+    for (code, _), edges in zip(chunk, _worker['model'].outgoing_edges_batch(states, _worker['bound'])):
+        results.append((code, [(codec.encode(edge.target), edge.probability, edge.label) for edge in edges]))
+    return results
+
+
+def generate_in_processes(ts, model, processes: int, max_time: float = np.inf, max_size: float = np.inf,
+                          checkpoint=None):
+    """
+    Generates the transition system using a pool of worker processes.
+
+    The frontier (ts.unprocessed) is explored level by level. Each level is split into chunks
+    which are processed independently by the workers, the results are merged back to the given
+    TransitionSystem by the main process. States travel between processes as compact tuples.
+
+    :param ts: TransitionSystem with filled StateStore, init and unprocessed states
+    :param model: Model or VectorModel providing outgoing_edges
+    :param processes: number of worker processes
+    :param max_time: max time for TS generating before interrupting
+    :param max_size: max allowed size of TS before interrupting
+    :param checkpoint: Checkpoint used to periodically save the TS (checked after each merged chunk)
+    :return: the given (extended) TransitionSystem
+    """
+    init = ts.states_encoding[ts.init]
+    vector = type(init.content) == Vector
+    codec = StateCodec(vector, len(init.content) if vector else 0, init.memory)
+
+    start_time = time.time()
+
+    def can_continue():
+        return time.time() - start_time < max_time and len(ts.states_encoding) < max_size
+
+    with multiprocessing.Pool(processes, init_worker, (model, ts.bound, codec)) as pool:
+        try:
+            while ts.unprocessed and can_continue():
+                frontier = [(code, codec.encode(ts.states_encoding[code])) for code in ts.unprocessed]
+                chunk_size = max(1, math.ceil(len(frontier) / (processes * 4)))
+                chunks = [frontier[i:i + chunk_size] for i in range(0, len(frontier), chunk_size)]
+
+                for results in pool.imap_unordered(explore_chunk, chunks):
+                    merge_results(ts, results, codec)
+                    if checkpoint and checkpoint.due(ts):
+                        checkpoint.save(ts)
+                    if not can_continue():
+                        break
+        except (KeyboardInterrupt, EOFError) as e:
+            pass
+
+    if checkpoint:
+        checkpoint.save(ts)
+    return ts
+
+
+def merge_results(ts, results: list, codec: StateCodec):
+    """
+    Merges processed states and their outgoing edges to the TransitionSystem.
+
+    :param ts: resulting TransitionSystem
+    :param results: output of explore_chunk
+    :param codec: used StateCodec
+    """
+    for source, edges in results:
+        ts.unprocessed.discard(source)
+
+        for data, probability, label in edges:
+            target = codec.decode(data)
+            code, is_new = ts.states_encoding.add(target)
+            if is_new:
+                ts.unprocessed.add(code)
+                ts.unique_complexes.update(set(target.content.value))
+            ts.edges.add(Edge(source, code, probability, label, encoded=True))
@@ -1,89 +1,185 @@
+import multiprocessing
 import threading
+import time
+
+import numpy as np
 
 from eBCSgen.TS.Edge import Edge
+from eBCSgen.TS.Frontier import Frontier
+
+BATCH_SIZE = 16
 
 
 class TSworker(threading.Thread):
-    def __init__(self, ts, reactions, definitions, regulation):
+    def __init__(self, ts, model, frontier: Frontier, max_size: float = np.inf):
         super(TSworker, self).__init__()
         self.ts = ts  # resulting transition system
-        self.reactions = reactions
-        self.definitions = definitions  # model.definitions
-        self.regulation = regulation  # model.regulation
-
-        self.stop_request = threading.Event()
-        self.work = threading.Event()  # to control whether the Worker is supposed to work
+        self.model = model  # Model or VectorModel providing outgoing_edges
+        self.frontier = frontier  # shared queue of unprocessed states
+        self.max_size = max_size
+        self.error = None  # exception raised while processing a state
 
     def run(self):
         """
-        Method takes a state from pool of states to be states and:
+        Method takes batches of codes of states from the shared Frontier and processes them
+        until the generating is finished or stopped.
+
+        Codes which were not processed (generating was stopped or paused in the meantime) are returned to the Frontier.
+        If processing of a state fails, the Frontier is stopped and the exception is stored in self.error.
+        """
+        while True:
+            batch = self.frontier.get(BATCH_SIZE)
+            if not batch:
+                return
+
+            processed = 0
+            try:
+                while processed < len(batch) and not (self.frontier.stopped or self.frontier.paused):
+                    self.process(batch[processed])
+                    processed += 1
+            except Exception as e:
+                self.error = e
+                self.frontier.stop()
+            finally:
+                self.frontier.done(batch[processed:])
+
+    def process(self, code: int):
+        """
+        Method takes a code of state and:
 
         - iteratively applies all rules on it
-        - checks whether newly created states (if any) were already states (present in self.ts.states_encoding);
-          if not, they are added to self.states_to_process
+        - adds newly created states to self.ts.states_encoding (StateStore); if they were not
+          discovered yet, their codes are added to the Frontier
         - creates Edge from the source state to created ones (since ts.edges is a set, we don't care about its presence)
         - all outgoing Edges from the state are normalised to probability
+
+        If the maximal size of TS is reached, the Frontier is stopped.
+
+        :param code: code of processed state
         """
-        while not self.stop_request.isSet():
-            self.work.wait()
-            try:
-                state = self.ts.unprocessed.pop()
-                self.ts.states.add(state)
-                unique_states = dict()
-
-                # special "hell" state
-                if state.is_hell:
-                    self.ts.edges.add(Edge(state, state, 1))
-                else:
-                    candidate_reactions = dict()
-                    for reaction in self.reactions:
-                        rate = reaction.evaluate_rate(state, self.definitions)
-                        matches = reaction.match(state, all=True)
-
-                        try:
-                            rate = rate if rate > 0 else None
-                        except TypeError:
-                            pass
-
-                        # drop rules which cannot be actually used (0 rate or no matches)
-                        if matches is not None and rate is not None:
-                            candidate_reactions[reaction] = (rate, matches)
-
-                    if self.regulation:
-                        candidate_reactions = self.regulation.filter(state, candidate_reactions)
-
-                    for reaction in candidate_reactions.keys():
-                        for match in candidate_reactions[reaction][1]:
-                            produced_agents = reaction.replace(match)
-                            match = reaction.reconstruct_complexes_from_match(match)
-                            new_state = state.update_state(match, produced_agents, reaction.label, self.ts.bound)
-
-                            if new_state not in self.ts.states:
-                                self.ts.unprocessed.add(new_state)
-                                self.ts.unique_complexes.update(set(new_state.content.value))
-
-                            # multiple arrows between two states are not allowed
-                            if new_state in unique_states:
-                                unique_states[new_state].add_rate(candidate_reactions[reaction][0])
-                            else:
-                                edge = Edge(state, new_state, candidate_reactions[reaction][0], reaction.label)
-                                unique_states[new_state] = edge
-
-                    edges = set(unique_states.values())
-
-                    # normalise
-                    factor = sum(list(map(lambda edge: edge.probability, edges)))
-                    if edges:
-                        for edge in edges:
-                            edge.normalise(factor)
-                            self.ts.edges.add(edge)
-                    else:
-                        # self loop to create correct DTMC
-                        self.ts.edges.add(Edge(state, state, 1, 'ε'))
-
-            except KeyError:
-                self.work.clear()
-
-    def join(self, timeout=None):
-        self.work.set()
-        self.stop_request.set()
+        state = self.ts.states_encoding[code]
+        new_states = []
+
+        for edge in self.model.outgoing_edges(state, self.ts.bound):
+            target, is_new = self.ts.states_encoding.add(edge.target)
+            if is_new:
+                new_states.append(target)
+                self.ts.unique_complexes.update(set(edge.target.content.value))
+            self.ts.edges.add(Edge(code, target, edge.probability, edge.label, encoded=True))
+
+        self.frontier.put(new_states)
+        if len(self.ts.states_encoding) >= self.max_size:
+            self.frontier.stop()
+
+
+def generate_in_threads(ts, model, max_time: float = np.inf, max_size: float = np.inf, checkpoint=None):
+    """
+    Generates the transition system using TSworker threads sharing a Frontier.
+
+    Returns immediately when all states are processed, or when max_time or max_size is reached.
+    In such case, codes of the remaining states are stored in ts.unprocessed.
+    An exception raised by a worker stops the generating and is raised again here.
+
+    If checkpoint is given, the workers are periodically paused and the TS is saved,
+    the last checkpoint is saved when the generating ends.
+
+    :param ts: TransitionSystem with filled StateStore, init and unprocessed states
+    :param model: Model or VectorModel providing outgoing_edges
+    :param max_time: max time for TS generating before interrupting
+    :param max_size: max allowed size of TS before interrupting
+    :param checkpoint: Checkpoint used to periodically save the TS
+    :return: the given (extended) TransitionSystem
+    """
+    frontier = Frontier(ts.unprocessed)
+    if len(ts.states_encoding) >= max_size:
+        frontier.stop()
+
+    workers = [TSworker(ts, model, frontier, max_size)
+               for _ in range(multiprocessing.cpu_count())]
+    for worker in workers:
+        worker.start()
+
+    deadline = time.time() + max_time
+
+    def timeout():
+        timeout = deadline - time.time()
+        if checkpoint:
+            timeout = min(timeout, checkpoint.timeout())
+        return None if timeout == np.inf else max(0, timeout)
+
+    try:
+        while not frontier.wait(timeout()):
+            if time.time() >= deadline:
+                frontier.stop()
+            elif checkpoint and checkpoint.due(ts):
+                frontier.pause()
+                ts.unprocessed = frontier.remaining()
+                checkpoint.save(ts)
+                frontier.resume()
+    # probably should be changed to a different exceptions for the case when the execution is stopped on Galaxy
+    # then also the ts should be exported to appropriate file
+    except (KeyboardInterrupt, EOFError) as e:
+        frontier.stop()
+
+    for worker in workers:
+        worker.join()
+
+    ts.unprocessed = frontier.remaining()
+    for worker in workers:
+        if worker.error is not None:
+            raise worker.error
+
+    if checkpoint:
+        checkpoint.save(ts)
+    return ts
+
+
+def process_state(state, match_cache, regulation, bound) -> list:
+    """
+    Computes all outgoing Edges of given State.
+
+    All rules are applied to the state, multiple arrows leading to the same
+    state are joined and finally the rates are normalised to probabilities.
+    Used by Model (rules), VectorModel has its own vectorised variant.
+
+    :param state: given State to be processed
+    :param match_cache: MatchCache of the model
+    :param regulation: model.regulation
+    :param bound: maximal allowed bound on individual values
+    :return: list of outgoing Edges
+    """
+    # special "hell" state
+    if state.is_hell:
+        return [Edge(state, state, 1)]
+
+    results = match_cache.compute(state)
+    candidate_reactions = match_cache.candidates(results)
+
+    if regulation:
+        candidate_reactions = regulation.filter(state, candidate_reactions)
+
+    unique_states = dict()
+    for reaction in candidate_reactions.keys():
+        for match in candidate_reactions[reaction][1]:
+            consumed, produced = reaction.apply(match)
+            new_state = state.update_state(consumed, produced, reaction.label, bound)
+            if not new_state.is_hell:
+                match_cache.inherit(results, state, new_state)
+
+            # multiple arrows between two states are not allowed
+            if new_state in unique_states:
+                unique_states[new_state].add_rate(candidate_reactions[reaction][0])
+            else:
+                edge = Edge(state, new_state, candidate_reactions[reaction][0], reaction.label)
+                unique_states[new_state] = edge
+
+    edges = list(unique_states.values())
+
+    # normalise
+    factor = sum(list(map(lambda edge: edge.probability, edges)))
+    if edges:
+        for edge in edges:
+            edge.normalise(factor)
+        return edges
+    # self loop to create correct DTMC
+    return [Edge(state, state, 1, 'ε')]
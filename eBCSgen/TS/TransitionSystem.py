@@ -1,11 +1,22 @@
 import json
+import operator
 from copy import copy
+from itertools import islice
 
 import numpy as np
+from scipy.sparse import csgraph
 from sortedcontainers import SortedList
 from pyModelChecking import Kripke
 
+from eBCSgen.TS.BinaryFormat import write_binary, encode_histories, MappedStates
+from eBCSgen.TS.Edge import Edge
+from eBCSgen.TS.EdgeArrays import EdgeArrays, edges_to_arrays
 from eBCSgen.TS.State import State, Memory, Vector
+from eBCSgen.TS.StateStore import StateStore, VectorStore
+
+CHUNK_SIZE = 10000  # number of states or edges written to a file at once
+
+AP_OPERATORS = {"=": operator.eq, "<": operator.lt, ">": operator.gt, "<=": operator.le, ">=": operator.ge}
 
 
 class TransitionSystem:
@@ -15,10 +26,9 @@ class TransitionSystem:
 
         # for TS generating
         self.unprocessed = set()
-        self.states = set()
         self.edges = set()
 
-        self.states_encoding = dict()  # int -> State
+        self.states_encoding = dict()  # int -> State (StateStore during generating)
 
         # for multiset approach
         self.unique_complexes = set()
@@ -64,9 +74,18 @@ class TransitionSystem:
 
     def encode(self):
         """
-        Assigns a unique code to each State for storing purposes
+        Assigns a unique code to each State (init, unprocessed States and States connected by Edges)
+        for storing purposes.
+
+        Not needed when states are kept in StateStore (codes are assigned at the moment of discovery).
         """
-        for state in self.states | self.unprocessed:
+        if isinstance(self.states_encoding, StateStore):
+            return
+
+        states = [self.init] if type(self.init) != int else []
+        states += list(self.unprocessed)
+        states += [state for edge in self.edges for state in (edge.source, edge.target)]
+        for state in states:
             if state not in self.states_encoding:
                 self.states_encoding[state] = len(self.states_encoding) + 1
 
@@ -84,12 +103,39 @@ class TransitionSystem:
         for edge in self.edges:
             edge.encode(self.states_encoding)
 
-    def decode(self):
+    def decode(self, memory: Memory = None):
         """
-        Flips encoding to continue in generating.
+        Moves encoded states to VectorStore to continue in generating.
+
+        Histories of states are kept, their Memory is restored using the given one (e.g. its automaton).
+        States have to keep Memory of the same level, otherwise states differing only in their
+        histories would be merged.
+
+        :param memory: Memory of the initial state (determines Memory used by regulation)
         """
-        self.init = self.states_encoding[self.init]
-        self.states_encoding = self.revert_encoding()
+        if not isinstance(self.edges, set):
+            # e.g. EdgeArrays of loaded binary TS
+            self.edges = set(self.edges)
+
+        if isinstance(self.states_encoding, StateStore):
+            return
+
+        level = memory.level if memory else 0
+        store = VectorStore(len(self.ordering), self.bound, memory, max(1024, len(self.states_encoding)))
+        recoding = dict()
+        for code in sorted(self.states_encoding):
+            state = self.states_encoding[code]
+            if not state.is_hell and state.memory.level != level:
+                raise ValueError("Memory of states ({}) does not match the regulation ({})."
+                                 .format(state.memory.level, level))
+            recoding[code] = store.add(state)[0]
+
+        if any(code != new_code for code, new_code in recoding.items()):
+            self.edges = {Edge(recoding[edge.source], recoding[edge.target], edge.probability, edge.label, True)
+                          for edge in self.edges}
+            self.init = recoding[self.init]
+            self.unprocessed = {recoding[code] for code in self.unprocessed}
+        self.states_encoding = store
 
     def revert_encoding(self) -> dict:
         """
@@ -112,23 +158,58 @@ class TransitionSystem:
         """
         Save current TS as a JSON file.
 
+        States and edges are streamed to the file in chunks (without indentation),
+        so the whole JSON structure is never built in memory.
+
         :param params: given set of unknown parameters
         :param output_file: given file to write to
         """
-        unique = list(map(str, self.ordering))
-        edges = [edge.to_dict() for edge in self.edges]
-        states = {key: str(state.content) for key, state in self.states_encoding.items()}
-
-        data = {'nodes': states, 'edges': edges, 'ordering': unique,
-                'initial': self.init, 'bound': int(self.bound)}
+        data = {'ordering': list(map(str, self.ordering)), 'initial': self.init, 'bound': int(self.bound)}
         if params:
             data['parameters'] = list(params)
 
         if self.unprocessed:
-            data['unprocessed'] = [str(state.content) for state in self.unprocessed]
+            data['unprocessed'] = [str(self.states_encoding[code].content) for code in self.unprocessed]
 
         with open(output_file, 'w') as json_file:
-            json.dump(data, json_file, indent=4)
+            json_file.write('{"nodes": {')
+            write_chunks(json_file, ('"{}": {}'.format(code, json.dumps(str(self.states_encoding[code].content)))
+                                     for code in self.states_encoding))
+            json_file.write('}, "edges": [')
+            write_chunks(json_file, (json.dumps(edge.to_dict()) for edge in self.edges))
+            json_file.write('], ' + json.dumps(data)[1:])
+
+    def save_to_binary(self, output_file: str, params=None):
+        """
+        Save current TS as a binary file (see BinaryFormat).
+
+        The file contains matrix of states, edges in CSR format (targets, probabilities
+        and labels ordered by source), ordering, init, bound, params and unprocessed states.
+        Probabilities with parameters are stored as strings in the header.
+        For regulated models, also level of Memory and histories of states are stored.
+
+        :param params: given set of unknown parameters
+        :param output_file: given file to write to
+        """
+        codes, rows, hell = self.states_matrix()
+        first = int(codes[0]) if len(codes) else 1
+        if len(codes) and codes[-1] - first + 1 != len(codes):
+            raise ValueError("Codes of states are not contiguous.")
+        edges = self.edge_arrays()
+
+        header = {'ordering': list(map(str, self.ordering)), 'initial': self.init, 'bound': int(self.bound),
+                  'first': first, 'hell': hell, 'labels': edges.label_names,
+                  'expressions': {int(i): p for i, p in edges.expressions.items()},
+                  'parameters': list(params) if params else []}
+        arrays = {'states': rows, 'indptr': edges.indptr, 'targets': edges.targets,
+                  'probabilities': edges.probabilities, 'edge_labels': edges.labels,
+                  'unprocessed': np.array(sorted(self.unprocessed), dtype=np.int64)}
+
+        memory, histories = self.states_histories(codes)
+        if memory:
+            header['memory'] = memory
+            header['history_items'], arrays['histories'], arrays['history_indptr'] = histories
+        write_binary(output_file, header, arrays)
 
     def change_hell(self):
         """
@@ -136,16 +217,16 @@ class TransitionSystem:
         """
         for key, state in self.states_encoding.items():
             if state.is_hell:
-                del self.states_encoding[key]
                 hell = State(Vector(np.array([self.bound + 1] * len(state.content.value))), Memory(0), True)
+                self.states_encoding = dict(self.states_encoding)
                 self.states_encoding[key] = hell
                 break
 
     def create_AP_labels(self, APs: list, include_init=True):
         """
         Creates label for each AtomicProposition.
-        Moreover, goes through all states in ts.states_encoding and validates whether they satisfy given
-        APs - if so, the particular label is assigned to the state.
+        Moreover, validates whether states in ts.states_encoding satisfy given APs (at once on
+        the matrix of states) - if so, the particular label is assigned to the state.
 
         :param APs: give AtomicProposition extracted from Formula
         :return: dictionary of State_code -> set of labels and AP -> label
@@ -154,11 +235,17 @@ class TransitionSystem:
         for ap in APs:
             AP_lables[ap] = "property_" + str(len(AP_lables))
 
+        codes, rows, hell = self.states_matrix()
         state_labels = dict()
-        for key, state in self.states_encoding.items():
-            for ap in APs:
-                if state.check_AP(ap, self.ordering):
-                    state_labels[key] = state_labels.get(key, set()) | {AP_lables[ap]}
+        for ap in APs:
+            weights = np.zeros(len(self.ordering), dtype=np.int64)
+            if ap.complex in self.ordering:
+                weights[self.ordering.index(ap.complex)] = 1
+            else:
+                weights[ap.complex.identify_compatible(self.ordering)] = 1
+            satisfied = AP_OPERATORS[ap.sign.strip()](rows @ weights, float(ap.number)) & (codes != hell)
+            for key in codes[satisfied].tolist():
+                state_labels[key] = state_labels.get(key, set()) | {AP_lables[ap]}
         if include_init:
             state_labels[self.init] = state_labels.get(self.init, set()) | {"init"}
         return state_labels, AP_lables
@@ -172,32 +259,35 @@ class TransitionSystem:
 
         vector_encoding = dict()
         for key, state in self.states_encoding.items():
-            state.to_vector(self.ordering)
-            vector_encoding[key] = state
+            vector_encoding[key] = State(state.content.to_vector(self.ordering, state.is_hell),
+                                         state.memory, state.is_hell)
         self.states_encoding = vector_encoding
 
     def save_to_STORM_explicit(self, transitions_file: str, labels_file: str, state_labels: dict, AP_labels):
         """
         Save the TransitionSystem as explicit Storm file (no parameters).
 
+        Edges are ordered by (source, target) codes using NumPy instead of sorting Edge objects
+        and both files are written in chunks.
+
         :param transitions_file: file for transitions
         :param labels_file: file for labels
         :param labels: labels representing atomic propositions assigned to states
         """
-        trans_file = open(transitions_file, "w+")
-        trans_file.write("dtmc\n")
-
-        for edge in sorted(self.edges):
-            trans_file.write(str(edge) + "\n")
-        trans_file.close()
+        edges = list(self.edges)
+        sources = np.fromiter((edge.source for edge in edges), dtype=np.int64, count=len(edges))
+        targets = np.fromiter((edge.target for edge in edges), dtype=np.int64, count=len(edges))
+        order = np.lexsort((targets, sources))
 
-        label_file = open(labels_file, "w+")
-        unique_labels = ['init'] + list(map(str, AP_labels.values()))
-        label_file.write("#DECLARATION\n" + " ".join(unique_labels) + "\n#END\n")
+        with open(transitions_file, "w+") as trans_file:
+            trans_file.write("dtmc\n")
+            write_chunks(trans_file, (str(edges[i]) + "\n" for i in order), "")
 
-        label_file.write("\n".join([str(state) + " " + " ".join(list(map(str, state_labels[state])))
-                                    for state in sorted(state_labels)]))
-        label_file.close()
+        with open(labels_file, "w+") as label_file:
+            unique_labels = ['init'] + list(map(str, AP_labels.values()))
+            label_file.write("#DECLARATION\n" + " ".join(unique_labels) + "\n#END\n")
+            write_chunks(label_file, (str(state) + " " + " ".join(list(map(str, state_labels[state])))
+                                      for state in sorted(state_labels)), "\n")
 
     def save_to_prism(self, output_file: str, params: set, prism_formulas: list):
         """
@@ -261,10 +351,86 @@ class TransitionSystem:
         :return: Kripke structure representation of the transition system
         """
         states = list(self.states_encoding.keys())
-        edges = [(edge.source, edge.target) for edge in self.edges]
+        edges = self.edge_arrays()
+        edges = list(zip(edges.sources.tolist(), edges.targets.tolist()))
         inits = [self.init]
         return Kripke(S=states, R=edges, S0=inits, L=state_labels)
 
+    def states_matrix(self):
+        """
+        Represents States (vector variant) as a matrix, taken directly from VectorStore or MappedStates if possible.
+
+        :return: array of codes, matrix of vectors (row i corresponds to codes[i]) and code of hell state (or None)
+        """
+        if isinstance(self.states_encoding, VectorStore):
+            return np.arange(1, len(self.states_encoding) + 1), self.states_encoding.vectors, self.states_encoding.hell
+        if isinstance(self.states_encoding, MappedStates):
+            first = self.states_encoding.first
+            return np.arange(first, first + len(self.states_encoding)), self.states_encoding.rows, self.states_encoding.hell
+
+        codes = np.array(sorted(self.states_encoding), dtype=np.int64)
+        dtype = np.min_scalar_type(int(self.bound) + 1) if self.bound else np.int64
+        rows = np.zeros((len(codes), len(self.ordering)), dtype=dtype)
+        hell = None
+        for i, code in enumerate(codes.tolist()):
+            state = self.states_encoding[code]
+            if state.is_hell:
+                hell = code
+            else:
+                rows[i] = state.content.value
+        return codes, rows, hell
+
+    def states_histories(self, codes: np.array):
+        """
+        Collects histories of Memory of States, taken directly from VectorStore or MappedStates if possible.
+
+        :param codes: codes of States (see states_matrix)
+        :return: level of Memory and histories encoded by encode_histories (None if level is 0)
+        """
+        if isinstance(self.states_encoding, VectorStore):
+            memory = self.states_encoding.memory
+            histories = self.states_encoding.histories
+        elif isinstance(self.states_encoding, MappedStates):
+            return self.states_encoding.memory, self.states_encoding.histories
+        else:
+            states = [self.states_encoding[code] for code in codes.tolist()]
+            memory = max([state.memory.level for state in states], default=0)
+            histories = [state.memory.history for state in states]
+        return memory, encode_histories(histories) if memory else None
+
+    def edge_arrays(self) -> EdgeArrays:
+        """
+        :return: Edges stored in EdgeArrays (taken directly if the TS was loaded from binary file)
+        """
+        if isinstance(self.edges, EdgeArrays):
+            return self.edges
+        codes = list(self.states_encoding)
+        first = min(codes) if codes else 1
+        return edges_to_arrays(self.edges, first, max(codes) - first + 1 if codes else 0)
+
+    def to_sparse(self):
+        """
+        Represents Edges as a sparse matrix of probabilities indexed by codes of States.
+
+        Parametric probabilities are nan in the matrix, their expressions are given in the parallel array.
+
+        :return: CSR matrix, object array of labels and object array of parametric probabilities
+                 (both parallel to matrix.data)
+        """
+        edges = self.edge_arrays()
+        return edges.to_csr(), edges.label_array(), edges.expression_array()
+
+    def reachable_states(self, source: int = None) -> set:
+        """
+        Computes States reachable from given State by breadth-first search on the sparse matrix.
+
+        :param source: code of the State, init if not given
+        :return: set of codes of reachable States
+        """
+        matrix = self.to_sparse()[0]
+        source = self.init if source is None else source
+        return set(csgraph.breadth_first_order(matrix, source, return_predecessors=False).tolist())
+
     def filter_unused_agents(self):
         """
         There are cases when agents which are always 0 are used.
@@ -272,7 +438,7 @@ class TransitionSystem:
 
         :return: minimalised TS
         """
-        check = Vector(np.zeros(len(list(self.states_encoding.values())[0].content)))
+        check = Vector(np.zeros(len(next(iter(self.states_encoding.values())).content)))
         for state in self.states_encoding.values():
             check += state.content
 
@@ -283,9 +449,10 @@ class TransitionSystem:
             if check.value[i] == 0:
                 to_remove.append(i)
 
+        states_encoding = dict()
         for code, state in self.states_encoding.items():
             new_sequence = np.delete(state.content.value, to_remove)
-            state.content.value = new_sequence
+            states_encoding[code] = State(Vector(new_sequence), state.memory, state.is_hell)
 
         for i in reversed(to_remove):
             del ordering[i]
@@ -293,10 +460,27 @@ class TransitionSystem:
         new_ts = TransitionSystem(ordering, self.bound)
         new_ts.init = self.init
         new_ts.edges = self.edges
-        new_ts.states_encoding = self.states_encoding
+        new_ts.states_encoding = states_encoding
         return new_ts
 
 
+def write_chunks(file, lines, separator: str = ", "):
+    """
+    Writes lines to given file joined by separator, CHUNK_SIZE lines at once.
+
+    :param file: opened file
+    :param lines: iterable of strings (possibly a generator)
+    :param separator: string put between lines
+    """
+    lines = iter(lines)
+    chunk = list(islice(lines, CHUNK_SIZE))
+    while chunk:
+        file.write(separator.join(chunk))
+        chunk = list(islice(lines, CHUNK_SIZE))
+        if chunk:
+            file.write(separator)
+
+
 def create_indices(ordering_1: SortedList, ordering_2: SortedList):
     """
     Creates indices np.array which represents how agents from ordering_1 have to be rearranged
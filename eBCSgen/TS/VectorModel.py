@@ -1,45 +1,32 @@
-import multiprocessing
-
-import time
 from scipy.integrate import odeint
 import numpy as np
 import pandas as pd
-import random
+from copy import copy
 from sortedcontainers import SortedList
 
-from eBCSgen.TS.State import State, Memory
-from eBCSgen.TS.TSworker import TSworker
+from eBCSgen.TS.Checkpoint import Checkpoint
+from eBCSgen.TS.Edge import Edge
+from eBCSgen.TS.Simulation import simulate_ensemble
+from eBCSgen.TS.State import State, Memory, Vector
+from eBCSgen.TS.StateStore import VectorStore
+from eBCSgen.TS.TSworker import generate_in_threads
+from eBCSgen.TS.TSprocessing import generate_in_processes
 from eBCSgen.TS.TransitionSystem import TransitionSystem
 
 AVOGADRO = 6.022 * 10 ** 23
 
 
-def fake_expovariate(rate):
-    return 0.1
-
-
-def handle_number_of_threads(number, workers):
-    """
-    Estimated number of required workers for current volume of unprocessed states.
-
-    :param number: volume of unprocessed states
-    :param workers: available workers
-    """
-    number = np.math.ceil((1 / 50.0) * number - 1 / 2.)
-    for (i, worker) in enumerate(workers):
-        if i <= number:
-            worker.work.set()
-        else:
-            worker.work.clear()
-
-
 class VectorModel:
-    def __init__(self, vector_reactions: set, init: State, ordering: SortedList, bound: int, regulation=None):
+    def __init__(self, vector_reactions: set, init: State, ordering: SortedList, bound: int, regulation=None,
+                 observables: dict = None):
         self.vector_reactions = vector_reactions
         self.init = init
         self.ordering = ordering
         self.bound = bound if bound else self.compute_bound()
         self.regulation = regulation
+        self.observables = observables if observables else dict()  # dict str -> vectorized Rate
+
+        self.compile_reactions()
 
     def __eq__(self, other: 'VectorModel') -> bool:
         return self.vector_reactions == other.vector_reactions and \
@@ -55,6 +42,22 @@ class VectorModel:
     def __hash__(self):
         return hash(str(self))
 
+    def compile_reactions(self):
+        """
+        Compiles vector reactions to dense stoichiometry matrices.
+
+        Row i of reactants matrix is the source of i-th reaction in self.reactions,
+        row i of delta matrix is the change caused by the reaction (target - source).
+        Reactions are sorted, so their order does not depend on hashing (e.g. in seeded simulations).
+        """
+        size = len(self.init.content)
+        self.reactions = sorted(self.vector_reactions)
+        self.reactants = np.zeros((len(self.reactions), size), dtype=np.int64)
+        self.delta = np.zeros((len(self.reactions), size), dtype=np.int64)
+        for i, reaction in enumerate(self.reactions):
+            self.reactants[i] = reaction.source.content.value
+            self.delta[i] = reaction.target.content.value - reaction.source.content.value
+
     def compute_bound(self):
         """
         Computes maximal bound from all reactions and initial state.
@@ -102,82 +105,49 @@ class VectorModel:
         df.insert(0, "times", t)
         return df
 
-    def stochastic_simulation(self, max_time: float, runs: int, testing: bool = False) -> pd.DataFrame:
+    def stochastic_simulation(self, max_time: float, runs: int, testing: bool = False, step: float = 0.01,
+                              seed: int = None, processes: int = None, variance: bool = False,
+                              times: list = None, observables: bool = False, method: str = "direct") -> pd.DataFrame:
         """
-        Gillespie algorithm implementation.
+        Gillespie algorithm implementation (see SSA).
+
+        Each step a random reaction is chosen with probability proportional to its rate in particular
+        VectorState, then such reaction is applied and next time is computed using exponential distribution.
 
-        Each step a random reaction is chosen by exponential distribution with density given as a sum
-        of all possible rates in particular VectorState.
-        Then such reaction is applied and next time is computed using Poisson distribution (random.expovariate).
+        All runs are recorded only at common time points, their mean (and variance) is computed on the fly,
+        so the memory is bounded by the size of the output. Instead of all complexes, only values
+        of observables can be recorded. Runs can be distributed to a pool of processes,
+        each run has its own seeded random Generator.
 
         :param max_time: time when simulation ends
         :param runs: how many time the process should be repeated (then average behaviour is taken)
+        :param testing: use fixed seed and fixed time step
+        :param step: distance between time points
+        :param seed: seed of random Generators of runs (random if not given)
+        :param processes: number of worker processes (serial if not given)
+        :param variance: include variance of each column (named var(column))
+        :param times: requested time points (overrides max_time and step)
+        :param observables: record only values of observables of the model
+        :param method: "direct" (SSA), "next_reaction" (NextReactionMethod, for large sparse networks)
+            or "tau_leaping" (TauLeaping, approximate, for large numbers of molecules)
         :return: simulated data
         """
-        header = list(map(str, self.ordering))
-        result_df = pd.DataFrame(columns=header)
-
-        if not testing:
-            time_step = random.expovariate
-        else:
-            random.seed(10)
-            time_step = fake_expovariate
-
-        for run in range(runs):
-            df = pd.DataFrame(columns=header, dtype=float)
-            solution = self.init
-            time = 0.0
-            while time < max_time:
-                # add to data
-                df.loc[time] = list(solution.content.value)
-
-                applied_reactions = pd.DataFrame(data=[(solution.update_state(reaction.source.content,
-                                                                              reaction.target.content,
-                                                                              None,
-                                                                              np.math.inf),
-                                                        reaction.match(solution),
-                                                        reaction.evaluate_rate(solution, None)
-                                                        )
-                                                       for reaction in self.vector_reactions],
-                                                 columns=["state", "match", "rate"])
-                applied_reactions = applied_reactions.dropna()
-                if not applied_reactions.empty:
-                    rates_sum = applied_reactions.sum()["rate"]
-                    sorted_applied = applied_reactions.sort_values(by=["rate"])
-                    sorted_applied["cumsum"] = sorted_applied.cumsum(axis=0)["rate"]
-
-                    # pick random reaction based on rates
-                    rand_number = rates_sum * random.random()
-                    sorted_applied.drop(sorted_applied[sorted_applied["cumsum"] < rand_number].index, inplace=True)
-                    solution = sorted_applied.iloc[0]["state"]
-                else:
-                    rates_sum = random.uniform(0.5, 0.9)
-
-                # update time
-                time += time_step(rates_sum)
-
-            if run != 0:
-                # union of the indexes
-                union_idx = df.index.union(result_df.index)
-                df = df.reindex(union_idx)
-                result_df = result_df.reindex(union_idx)
-
-                # interpolate both
-                df = df.interpolate(method='linear', limit_direction='forward', axis=0)
-                result_df = result_df.interpolate(method='linear', limit_direction='forward', axis=0)
-
-                # concat both and compute average
-                result_df = pd.concat([df, result_df])
-                result_df = result_df.groupby(level=0).mean()
-            else:
-                result_df = df
-
-        result_df.index.name = 'times'
-        result_df.reset_index(inplace=True)
-        return result_df
+        times = np.arange(0, max_time + step, step) if times is None else np.sort(np.array(times, dtype=float))
+        seed, fixed_step = (10, 0.1) if testing else (seed, None)
+        statistics = simulate_ensemble(self, times, runs, seed, processes, fixed_step, observables, method)
+
+        header = list(self.observables) if observables else list(map(str, self.ordering))
+        df = pd.DataFrame(data=statistics.mean, columns=header)
+        if variance:
+            for i, column in enumerate(header):
+                df["var({})".format(column)] = statistics.variance[:, i]
+        df.insert(0, "times", times)
+        return df
 
-    def generate_transition_system(self, ts: TransitionSystem = None,
-                                   max_time: float = np.inf, max_size: float = np.inf) -> TransitionSystem:
+    def generate_transition_system(self, ts: TransitionSystem = None, max_time: float = np.inf,
+                                   max_size: float = np.inf, processes: int = None, checkpoint_file: str = None,
+                                   checkpoint_interval: float = np.inf,
+                                   checkpoint_size: float = np.inf) -> TransitionSystem:
         """
         Parallel implementation of Transition system generating.
 
@@ -185,44 +155,163 @@ class VectorModel:
 
         If the given bound should be exceeded, a special infinite state is introduced.
 
-        The algorithm dynamically changes number of active workers using thread events. This is done according to the
-        current volume of unprocessed states.
+        The workers share a Frontier of unprocessed States and the generating ends as soon as it is empty
+        and no worker is busy (or when max_time or max_size is reached).
+
+        If number of processes is given, the states are explored by a pool of worker processes instead
+        (see TSprocessing.generate_in_processes).
 
+        If checkpoint_file is given, the partially generated TS is saved there in binary format
+        every checkpoint_interval seconds or checkpoint_size new states (and when the generating ends).
+        It can be continued after load_TS_from_binary.
+
+        :param ts: partially generated TransitionSystem to continue with
+        :param max_time: max time for TS generating before interrupting
+        :param max_size: max allowed size of TS before interrupting
+        :param processes: number of worker processes, threads are used if not given
+        :param checkpoint_file: file for checkpoints
+        :param checkpoint_interval: time (in seconds) between two checkpoints
+        :param checkpoint_size: number of new states between two checkpoints
         :return: generated Transition system
         """
+        memory = Memory(0) if not self.regulation else self.regulation.create_memory()
         if not ts:
             ts = TransitionSystem(self.ordering, self.bound)
-            memory = 0 if not self.regulation else self.regulation.memory
-            ts.init = State(self.init.content, Memory(memory))
+            ts.states_encoding = VectorStore(len(self.ordering), self.bound, memory)
+            ts.init, _ = ts.states_encoding.add(State(self.init.content, memory))
             ts.unprocessed = {ts.init}
         else:
-            ts.decode()
+            ts.decode(memory)
+
+        checkpoint = None
+        if checkpoint_file:
+            checkpoint = Checkpoint(checkpoint_file, checkpoint_interval, checkpoint_size)
+
+        if processes:
+            return generate_in_processes(ts, self, processes, max_time, max_size, checkpoint)
+
+        return generate_in_threads(ts, self, max_time, max_size, checkpoint)
+
+    def propensities(self, values: np.array) -> np.array:
+        """
+        Evaluates rates of all reactions in a block of states at once.
 
-        workers = [TSworker(ts, self.vector_reactions, None, self.regulation)
-                   for _ in range(multiprocessing.cpu_count())]
-        for worker in workers:
-            worker.start()
+        Rates of reactions which are not enabled in particular state (not enough reactants) are 0,
+        the rates are evaluated (see Rate.evaluate_batch) only in states where the reaction is enabled.
+        The result is a float matrix. If some rates contain unresolved parameters or have exceptional
+        values (e.g. division by zero), an object matrix of Sympy expressions is returned instead.
 
-        workers[0].work.set()
-        start_time = time.time()
+        :param values: 2-D array of states, one state per row
+        :return: matrix of rates (states x self.reactions)
+        """
+        columns = []
+        for reaction, reactants in zip(self.reactions, self.reactants):
+            # only species consumed by the reaction are compared
+            species = np.flatnonzero(reactants)
+            enabled = np.all(values[:, species] >= reactants[species], axis=1)
+            columns.append((enabled, reaction.rate.evaluate_batch(values[enabled])))
+        numeric = all(column.dtype != object for _, column in columns)
+
+        result = np.zeros((len(values), len(self.reactions)), dtype=float if numeric else object)
+        for i, (enabled, column) in enumerate(columns):
+            result[enabled, i] = column
+        return result
+
+    def outgoing_edges(self, state: State, bound) -> list:
+        """
+        Computes all outgoing Edges of given State using the stoichiometry matrices.
 
-        try:
-            while any([worker.work.is_set() for worker in workers]) \
-                    and time.time() - start_time < max_time \
-                    and len(ts.states) + len(ts.states_encoding) < max_size:
-                handle_number_of_threads(len(ts.unprocessed), workers)
-                time.sleep(1)
-        # probably should be changed to a different exceptions for the case when the execution is stopped on Galaxy
-        # then also the ts should be exported to appropriate file
-        except (KeyboardInterrupt, EOFError) as e:
-            pass
+        Enabled reactions are obtained by a single comparison of the state with reactants matrix,
+        all successors by a single addition of delta matrix and the bound is checked on all of them at once.
+        Multiple arrows leading to the same state are joined and rates are normalised to probabilities.
 
-        for worker in workers:
-            worker.join()
+        :param state: given State
+        :param bound: maximal allowed bound on individual values
+        :return: list of Edges
+        """
+        # special "hell" state
+        if state.is_hell:
+            return [Edge(state, state, 1)]
 
-        while any([worker.is_alive() for worker in workers]):
-            time.sleep(1)
+        rates = dict()
+        for i in np.flatnonzero(np.all(state.content.value >= self.reactants, axis=1)):
+            rates[i] = self.reactions[i].evaluate_rate(state, None)
+        return self.create_edges(state, rates, bound)
 
-        ts.encode()
+    def outgoing_edges_batch(self, states: list, bound) -> list:
+        """
+        Computes outgoing Edges of a block of States, rates of all of them are evaluated at once.
 
-        return ts
+        :param states: given States
+        :param bound: maximal allowed bound on individual values
+        :return: list of lists of Edges (in the order of given states)
+        """
+        regular = [state for state in states if not state.is_hell]
+        if regular:
+            rates = iter(self.propensities(np.array([state.content.value for state in regular])))
+
+        result = []
+        for state in states:
+            if state.is_hell:
+                result.append([Edge(state, state, 1)])
+            else:
+                row = next(rates)
+                result.append(self.create_edges(state, {i: row[i] for i in np.flatnonzero(row != 0)}, bound))
+        return result
+
+    def create_edges(self, state: State, rates: dict, bound) -> list:
+        """
+        Creates outgoing Edges of given State from rates of enabled reactions.
+
+        :param state: given State
+        :param rates: dict of (index of reaction in self.reactions, its rate)
+        :param bound: maximal allowed bound on individual values
+        :return: list of Edges normalised to probabilities
+        """
+        values = state.content.value
+        candidate_reactions = dict()
+        for i, rate in rates.items():
+            reaction = self.reactions[i]
+
+            try:
+                rate = rate if rate > 0 else None
+            except TypeError:
+                pass
+
+            # drop reactions which cannot be actually used (0 rate)
+            if rate is not None:
+                candidate_reactions[reaction] = (rate, i)
+
+        if self.regulation:
+            candidate_reactions = self.regulation.filter(state, candidate_reactions)
+
+        reactions = list(candidate_reactions.keys())
+        successors = values + self.delta[[candidate_reactions[reaction][1] for reaction in reactions]]
+        exceeded = np.any(successors > bound, axis=1)
+
+        unique_states = dict()
+        for reaction, successor, is_hell in zip(reactions, successors, exceeded):
+            rate = candidate_reactions[reaction][0]
+            if is_hell:
+                new_state = State(Vector(np.array([np.inf] * len(values))), Memory(0), True)
+            else:
+                memory = copy(state.memory)
+                memory.update_memory(reaction.label)
+                new_state = State(Vector(successor), memory)
+
+            # multiple arrows between two states are not allowed
+            if new_state in unique_states:
+                unique_states[new_state].add_rate(rate)
+            else:
+                unique_states[new_state] = Edge(state, new_state, rate, reaction.label)
+
+        edges = list(unique_states.values())
+
+        # normalise
+        factor = sum(list(map(lambda edge: edge.probability, edges)))
+        if edges:
+            for edge in edges:
+                edge.normalise(factor)
+            return edges
+        # self loop to create correct DTMC
+        return [Edge(state, state, 1, 'ε')]
@@ -1,3 +1,5 @@
+from copy import copy
+
 from eBCSgen.Core.Rate import Rate
 from eBCSgen.TS.State import State
 
@@ -8,6 +10,7 @@ class VectorReaction:
         self.target = target
         self.rate = rate
         self.label = label
+        self.hash_value = None
 
     def __str__(self):
         label = self.label + " ~ " if self.label else ""
@@ -23,7 +26,15 @@ class VectorReaction:
         return str(self) < str(other)
 
     def __hash__(self):
-        return hash(str(self))
+        # source and target are not changed once the reaction is created (unlike rate, see to_symbolic)
+        if self.hash_value is None:
+            self.hash_value = hash((self.source, self.target))
+        return self.hash_value
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['hash_value'] = None
+        return state
 
     def evaluate_rate(self, state, definitions):
         _ = definitions  # unused argument
@@ -46,5 +57,8 @@ class VectorReaction:
     def to_symbolic(self):
         """
         Transforms rate of the reaction to symbolic representation (used in ODEs).
+
+        The rate might be shared with other reactions created from the same rule, so it is copied.
         """
+        self.rate = copy(self.rate)
         self.rate.to_symbolic()